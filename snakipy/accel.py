@@ -0,0 +1,402 @@
+"""
+Optional JIT-compiled single-snake simulation.
+
+The kernel runs the rules of `Game.step` for one `NeuroSnake` over flat
+arrays: a dense occupancy grid, the body as a growing coordinate array
+and the fruits as a short list. Decisions are read from the policy
+table of the net if it has one. Otherwise the net is evaluated the first
+time an input occurs and the decision is kept in a table filled on
+demand, so fresh DNAs do not pay for compiling the whole table.
+Fruit positions are drawn up front from the same random state as the
+game would use, so both backends play identical games.
+
+Numba is optional. Without it `resolve_backend` falls back to the
+pure-Python `Game`.
+"""
+import logging
+
+import numpy as np
+
+from snakipy.board import MAX_RASTER_CELLS
+from snakipy.game import DEATH_REWARD, DISTANCE_REWARD, FRUIT_REWARD
+from snakipy.neuro import NeuralNet
+from snakipy.snake import MOVES
+
+logger = logging.getLogger(__name__)
+
+try:
+    from numba import njit
+
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+BACKENDS = ("auto", "numba", "python")
+
+# Sensor rays in the order of `Game.reduced_coordinates`, starting north
+RAY_DX = np.array([0, 1, 1, 1, 0, -1, -1, -1])
+RAY_DY = np.array([-1, -1, 0, 1, 1, 1, 0, -1])
+# Steps of `MOVES`
+MOVE_DX = np.array([0, 1, 0, -1])
+MOVE_DY = np.array([-1, 0, 1, 0])
+
+
+@njit(cache=True)
+def _decide(w1, w2, index):
+    """`NeuralNet.decide` for the binary input packed into `index`"""
+    n_inputs = w1.shape[0] - 1
+    n_hidden = w1.shape[1]
+    hidden = np.empty(n_hidden)
+    for j in range(n_hidden):
+        total = 0.0
+        for i in range(n_inputs):
+            if (index >> i) & 1:
+                total += w1[i, j]
+        hidden[j] = np.tanh(total + w1[n_inputs, j])
+    best = 0
+    best_value = -np.inf
+    for k in range(w2.shape[1]):
+        total = 0.0
+        for j in range(n_hidden):
+            total += hidden[j] * w2[j, k]
+        value = total + w2[n_hidden, k]
+        if value > best_value:
+            best = k
+            best_value = value
+    return best
+
+
+@njit(cache=True)
+def _first_repeat(body_x, body_y, tails, moves, start, period):
+    """
+    First step after `start` whose state equals the state `period` steps
+    earlier. The body after step t is body[tails[t] : t + 2].
+    """
+    for t in range(start + period, len(moves)):
+        s = t - period
+        n = t + 2 - tails[t]
+        if moves[t] != moves[s] or n != s + 2 - tails[s]:
+            continue
+        same = True
+        for i in range(n):
+            if (
+                body_x[tails[t] + i] != body_x[tails[s] + i]
+                or body_y[tails[t] + i] != body_y[tails[s] + i]
+            ):
+                same = False
+                break
+        if same:
+            return t
+    return -1
+
+
+@njit(cache=True)
+def _simulate(
+    table,
+    w1,
+    w2,
+    width,
+    height,
+    border,
+    max_fruits,
+    fruit_draws,
+    x,
+    y,
+    move,
+    length,
+    max_steps,
+    heads,
+    detect_loops,
+    loop_penalty,
+):
+    """
+    Play one game. The head position after each step is written to `heads`.
+    Returns the score and the number of steps.
+
+    With `detect_loops` the game ends when the snake repeats a state since
+    its last fruit. Brent's cycle detection finds the period, then the
+    game is cut back to the first repeated state, where `LoopDetector`
+    stops. The skipped steps are scored like `LoopDetector.finish` does:
+    `loop_penalty` is added, or the rewards of the cycle are extrapolated
+    if it is NaN.
+    """
+    grid = np.zeros((height, width), dtype=np.int32)
+    body_x = np.empty(max_steps + 1, dtype=np.int64)
+    body_y = np.empty(max_steps + 1, dtype=np.int64)
+    body_x[0] = x
+    body_y[0] = y
+    tail, end = 0, 1
+    grid[y, x] = 1
+
+    fruit_x = np.empty(max_fruits, dtype=np.int64)
+    fruit_y = np.empty(max_fruits, dtype=np.int64)
+    n_fruits = 0
+    n_drawn = 0
+    while n_fruits < max_fruits:
+        fruit_x[n_fruits] = fruit_draws[n_drawn, 0]
+        fruit_y[n_fruits] = fruit_draws[n_drawn, 1]
+        n_fruits += 1
+        n_drawn += 1
+
+    score = 0.0
+    closest = -1
+    scores = np.empty(max_steps)
+    snap_x = np.empty(max_steps + 1, dtype=np.int64)
+    snap_y = np.empty(max_steps + 1, dtype=np.int64)
+    snap_len = -1
+    snap_move = -1
+    snap_step = 0
+    power = 1
+    # Tail index and move after every step, to rewind to the first repeat
+    tails = np.empty(max_steps, dtype=np.int64)
+    moves = np.empty(max_steps, dtype=np.int64)
+    context_step = 0
+    for step in range(max_steps):
+        hx = body_x[end - 1]
+        hy = body_y[end - 1]
+
+        # Sensors, already rotated into the frame of the snake
+        index = 0
+        for k in range(8):
+            ray = (k + 2 * move) % 8
+            dx = RAY_DX[ray]
+            dy = RAY_DY[ray]
+            nx = hx + dx
+            ny = hy + dy
+            if border and (nx == -1 or nx == width or ny == -1 or ny == height):
+                index |= 1 << (2 * k + 1)
+            elif 0 <= nx < width and 0 <= ny < height and grid[ny, nx] > 0:
+                index |= 1 << (2 * k + 1)
+
+            for f in range(n_fruits):
+                fx = fruit_x[f]
+                fy = fruit_y[f]
+                if not (0 <= fx < width and 0 <= fy < height):
+                    continue
+                if dy == 0:
+                    on_line = fy == hy
+                elif dx == 0:
+                    on_line = fx == hx
+                elif dx == dy:
+                    on_line = fx - fy == hx - hy
+                else:
+                    on_line = fx + fy == hx + hy
+                if not on_line:
+                    continue
+                if dx != 0 and (fx - hx) * dx <= 0:
+                    continue
+                if dy != 0 and (fy - hy) * dy <= 0:
+                    continue
+                index |= 1 << (2 * k)
+                break
+
+        decision = table[index]
+        if decision < 0:
+            decision = _decide(w1, w2, index)
+            table[index] = decision
+        move = (move + decision - 1) % 4
+
+        # Move the snake
+        nx = hx + MOVE_DX[move]
+        ny = hy + MOVE_DY[move]
+        body_x[end] = nx
+        body_y[end] = ny
+        end += 1
+        while end - tail > length:
+            grid[body_y[tail], body_x[tail]] -= 1
+            tail += 1
+        inside = 0 <= nx < width and 0 <= ny < height
+        if inside:
+            grid[ny, nx] += 1
+        heads[step, 0] = nx
+        heads[step, 1] = ny
+
+        # Collisions
+        dead = False
+        ate = False
+        if not inside:
+            score += DEATH_REWARD
+            dead = True
+        for f in range(n_fruits):
+            if fruit_x[f] == nx and fruit_y[f] == ny:
+                for g in range(f, n_fruits - 1):
+                    fruit_x[g] = fruit_x[g + 1]
+                    fruit_y[g] = fruit_y[g + 1]
+                n_fruits -= 1
+                score += FRUIT_REWARD
+                length += 1
+                ate = True
+                break
+        if inside and grid[ny, nx] > 1:
+            score += DEATH_REWARD
+            dead = True
+
+        while n_fruits < max_fruits:
+            fruit_x[n_fruits] = fruit_draws[n_drawn, 0]
+            fruit_y[n_fruits] = fruit_draws[n_drawn, 1]
+            n_fruits += 1
+            n_drawn += 1
+
+        # Distance reward
+        distance = 0
+        if n_fruits:
+            distance = abs(fruit_x[0] - nx) + abs(fruit_y[0] - ny)
+            for f in range(1, n_fruits):
+                distance = min(distance, abs(fruit_x[f] - nx) + abs(fruit_y[f] - ny))
+        if closest >= 0:
+            if distance < closest:
+                score += DISTANCE_REWARD
+            elif distance > closest:
+                score -= DISTANCE_REWARD
+        closest = distance
+        scores[step] = score
+
+        if dead:
+            return score, step + 1
+        if not detect_loops:
+            continue
+
+        tails[step] = tail
+        moves[step] = move
+        n_body = end - tail
+        same = not ate and n_body == snap_len and move == snap_move
+        if same:
+            for i in range(n_body - 1, -1, -1):
+                if body_x[tail + i] != snap_x[i] or body_y[tail + i] != snap_y[i]:
+                    same = False
+                    break
+        if same:
+            period = step - snap_step
+            step = _first_repeat(
+                body_x, body_y, tails, moves[: step + 1], context_step, period
+            )
+            score = scores[step]
+            remaining = max_steps - step - 1
+            if not np.isnan(loop_penalty):
+                return score + loop_penalty, step + 1
+            n_cycles = remaining // period
+            rest = remaining % period
+            first = step - period
+            start = scores[first]
+            score += n_cycles * (score - start) + (scores[first + rest] - start)
+            return score, step + 1
+        if ate or snap_len < 0:
+            context_step = step
+        if ate or snap_len < 0 or step - snap_step == power:
+            power = 1 if ate or snap_len < 0 else 2 * power
+            snap_x[:n_body] = body_x[tail:end]
+            snap_y[:n_body] = body_y[tail:end]
+            snap_len = n_body
+            snap_move = move
+            snap_step = step
+    return score, max_steps
+
+
+def draw_fruits(seed, width, height, n):
+    """
+    The first `n` fruit positions a `Game` with this seed would place.
+
+    Examples:
+        >>> rng = np.random.RandomState(4)
+        >>> fruits = [[rng.randint(0, 19), rng.randint(0, 29)] for _ in range(3)]
+        >>> draw_fruits(4, 20, 30, 3).tolist() == fruits
+        True
+    """
+    rng = np.random.RandomState(seed)
+    if width == height:
+        # Same bounds for x and y, so one vectorized call yields the same numbers
+        return rng.randint(0, width - 1, size=2 * n).reshape(n, 2)
+    draws = np.empty((n, 2), dtype=int)
+    for i in range(n):
+        draws[i] = rng.randint(0, width - 1), rng.randint(0, height - 1)
+    return draws
+
+
+def supports(game_options, snake_options):
+    """
+    Whether the kernel implements this game configuration.
+    The kernel allocates a dense grid per game, so large boards are left
+    to the sparse board of `Game`.
+
+    Examples:
+        >>> snake_options = {"direction": MOVES[0]}
+        >>> supports({"width": 20}, snake_options)
+        True
+        >>> supports({"width": 10_000, "height": 10_000}, snake_options)
+        False
+    """
+    width = game_options["width"]
+    height = game_options.get("height") or width
+    return (
+        width * height <= MAX_RASTER_CELLS
+        and snake_options.get("input_size", 16) == 2 * len(RAY_DX)
+        and not snake_options.get("periodic", False)
+        and snake_options.get("direction") in MOVES
+    )
+
+
+def simulate(
+    game_options, snake_options, dna, max_steps, detect_loops=False, loop_penalty=None
+):
+    """
+    Play a single-snake game with the kernel.
+    Returns the score and the head position after every simulated step.
+    """
+    width = game_options["width"]
+    height = game_options.get("height") or width
+    max_fruits = game_options.get("max_number_of_fruits", 1)
+    if game_options.get("number_of_steps") is not None:
+        max_steps = min(max_steps, game_options["number_of_steps"])
+    net = NeuralNet(
+        snake_options.get("input_size", 16),
+        snake_options.get("hidden_size", 5),
+        3,
+        dna=dna,
+    )
+    table = net.registered_policy()
+    if table is None:
+        # Filled by the kernel as inputs occur
+        table = np.full(2 ** (net.W1.shape[0] - 1), -1, dtype=np.int8)
+    heads = np.empty((max_steps, 2), dtype=np.int64)
+    score, n_steps = _simulate(
+        table.astype(np.int8, copy=False),
+        net.W1,
+        net.W2,
+        width,
+        height,
+        bool(game_options.get("border", False)),
+        max_fruits,
+        draw_fruits(game_options.get("seed"), width, height, max_fruits + max_steps),
+        snake_options["x"],
+        snake_options["y"],
+        MOVES.index(snake_options["direction"]),
+        3,
+        max_steps,
+        heads,
+        detect_loops,
+        np.nan if loop_penalty is None else float(loop_penalty),
+    )
+    return score, heads[:n_steps]
+
+
+def resolve_backend(backend, game_options, snake_options):
+    """The backend which will actually be used for `backend`"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend}")
+    if backend == "python":
+        return "python"
+    if not HAVE_NUMBA:
+        if backend == "numba":
+            logger.warning("Numba is not installed, using the Python backend")
+        return "python"
+    if not supports(game_options, snake_options):
+        if backend == "numba":
+            logger.warning("Game options not supported by the kernel, using Python")
+        return "python"
+    return "numba"
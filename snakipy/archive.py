@@ -0,0 +1,149 @@
+"""Append-only, memory-mapped archive of evaluated DNA"""
+import logging
+import os
+import struct
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b"SNKDNA01"
+# Magic, dna size and number of records, padded to keep the records aligned
+HEADER = struct.Struct("<8sqq")
+HEADER_SIZE = 64
+MIN_CAPACITY = 1024
+
+
+def record_dtype(dna_size):
+    return np.dtype(
+        [
+            ("generation", "<i8"),
+            ("fitness", "<f8"),
+            ("seed", "<i8"),
+            ("dna", "<f8", (dna_size,)),
+        ]
+    )
+
+
+class DNAArchive:
+    """
+    Every DNA of every generation together with its fitness and seed,
+    stored in one growable file which is memory-mapped instead of loaded.
+    Records are only ever appended, generation by generation.
+
+    Examples:
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), "dna.archive")
+        >>> archive = DNAArchive(path, dna_size=3)
+        >>> archive.append(np.zeros((4, 3)), fitness=[1, 5, 2, 3])
+        0
+        >>> archive.append(np.ones((4, 3)), fitness=[0, 7, 1, 1])
+        1
+        >>> len(archive), archive.generation(1)["fitness"].tolist()
+        (8, [0.0, 7.0, 1.0, 1.0])
+        >>> archive.best(2)["fitness"].tolist()
+        [7.0, 5.0]
+        >>> archive.close()
+        >>> len(DNAArchive(path))
+        8
+    """
+
+    def __init__(self, path, dna_size=None):
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb") as f:
+                magic, stored_size, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a DNA archive")
+            if dna_size is not None and dna_size != stored_size:
+                raise ValueError(
+                    f"Archive stores DNA of size {stored_size}, not {dna_size}"
+                )
+            self.dna_size = stored_size
+            self.count = count
+        else:
+            if dna_size is None:
+                raise ValueError("dna_size is needed to create a new archive")
+            self.dna_size = dna_size
+            self.count = 0
+            with open(path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, dna_size, 0).ljust(HEADER_SIZE, b"\0"))
+
+        self.dtype = record_dtype(self.dna_size)
+        self._map(max(self.count, MIN_CAPACITY))
+
+    def _map(self, capacity):
+        size = HEADER_SIZE + capacity * self.dtype.itemsize
+        if os.path.getsize(self.path) < size:
+            with open(self.path, "r+b") as f:
+                f.truncate(size)
+        self.capacity = capacity
+        self._records = np.memmap(
+            self.path, dtype=self.dtype, mode="r+", offset=HEADER_SIZE, shape=capacity
+        )
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def records(self):
+        """Memory-mapped view of all records"""
+        return self._records[: self.count]
+
+    @property
+    def n_generations(self):
+        if not self.count:
+            return 0
+        return int(self._records["generation"][self.count - 1]) + 1
+
+    def append(self, dnas, fitness, seeds=None, generation=None):
+        """Store one generation. Returns its generation number."""
+        dnas = np.atleast_2d(dnas)
+        n = len(dnas)
+        if generation is None:
+            generation = self.n_generations
+        if self.count + n > self.capacity:
+            self._records.flush()
+            self._map(max(2 * self.capacity, self.count + n))
+
+        new = self._records[self.count : self.count + n]
+        new["generation"] = generation
+        new["fitness"] = fitness
+        new["seed"] = -1 if seeds is None else seeds
+        new["dna"] = dnas
+        self.count += n
+        self.flush()
+        return generation
+
+    def truncate(self, count):
+        """Forget all records after the first `count`, e.g. to resume a run"""
+        self.count = min(count, self.count)
+        self.flush()
+
+    def flush(self):
+        self._records.flush()
+        with open(self.path, "r+b") as f:
+            f.write(HEADER.pack(MAGIC, self.dna_size, self.count))
+
+    def generation(self, generation):
+        """All records of one generation"""
+        generations = self.records["generation"]
+        start, end = np.searchsorted(generations, [generation, generation + 1])
+        return self.records[start:end]
+
+    def best(self, n):
+        """The n records with the highest fitness, best first"""
+        fitness = self.records["fitness"]
+        n = min(n, self.count)
+        top = np.argpartition(fitness, self.count - n)[self.count - n :]
+        return self.records[top[np.argsort(fitness[top])[::-1]]]
+
+    def sample(self, n, top=100, rng=np.random):
+        """Hall-of-fame sample: n records drawn from the `top` best ones"""
+        hall_of_fame = self.best(top)
+        return hall_of_fame[rng.randint(0, len(hall_of_fame), size=n)]
+
+    def close(self):
+        self.flush()
+        del self._records
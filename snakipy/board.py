@@ -0,0 +1,357 @@
+"""Sparse occupancy index for the game board"""
+from itertools import count
+from typing import Dict, Set, Tuple
+
+import numpy as np
+
+from snakipy.snake import Direction
+
+
+TILE_SIZE = 64
+# Below this number of fruits a nearest-fruit query simply checks all of them
+BRUTE_FORCE_FRUITS = 16
+
+# Unit steps of the eight sensor rays
+RAY_STEPS = {
+    Direction.NORTH: (0, -1),
+    Direction.NORTHEAST: (1, -1),
+    Direction.EAST: (1, 0),
+    Direction.SOUTHEAST: (1, 1),
+    Direction.SOUTH: (0, 1),
+    Direction.SOUTHWEST: (-1, 1),
+    Direction.WEST: (-1, 0),
+    Direction.NORTHWEST: (-1, -1),
+}
+RAY_DX = np.array([dx for dx, _ in RAY_STEPS.values()])
+RAY_DY = np.array([dy for _, dy in RAY_STEPS.values()])
+RAY_INDEX = {direction: i for i, direction in enumerate(RAY_STEPS)}
+# Boards with more cells are too large to be rasterized for every step
+MAX_RASTER_CELLS = 1 << 22
+
+
+def _line_keys(x, y):
+    """Keys of the row, column, diagonal and anti-diagonal through (x, y)"""
+    return (("row", y), ("col", x), ("diag", x - y), ("anti", x + y))
+
+
+def _ray_line(x, y, direction):
+    dx, dy = RAY_STEPS[direction]
+    if dy == 0:
+        return ("row", y)
+    if dx == 0:
+        return ("col", x)
+    if dx == dy:
+        return ("diag", x - y)
+    return ("anti", x + y)
+
+
+class ChunkedBoard:
+    """
+    Sparse board made of square tiles which are only allocated where
+    snake cells exist.
+
+    Snake cells are stored as occupancy counts, so overlapping snakes
+    (i.e. collisions) can be detected by looking at a single cell.
+    Fruits are indexed by the rows, columns and diagonals they lie on,
+    which lets the sensor rays inspect only the fruits on their line
+    instead of walking every cell up to the border.
+    Memory and query cost therefore scale with the number of occupied
+    cells and not with the board area.
+    """
+
+    def __init__(self, width, height, tile_size=TILE_SIZE):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self._tiles: Dict[Tuple[int, int], np.ndarray] = {}
+        self._tile_counts: Dict[Tuple[int, int], int] = {}
+        # Tiles which are not shared with a copy of this board
+        self._owned: Set[Tuple[int, int]] = set()
+        self._fruit_lines: Dict[Tuple[str, int], Dict[Tuple[int, int], int]] = {}
+        self._fruit_tiles: Dict[Tuple[int, int], Dict[Tuple[int, int], int]] = {}
+        self._n_fruit_cells = 0
+        # Set while the fruit indices are shared with a copy of this board
+        self._fruits_shared = False
+
+    def _locate(self, x, y):
+        tx, ox = divmod(x, self.tile_size)
+        ty, oy = divmod(y, self.tile_size)
+        return (tx, ty), (oy, ox)
+
+    @property
+    def n_tiles(self):
+        return len(self._tiles)
+
+    def copy(self):
+        """
+        Copy-on-write copy of the board.
+        Tiles are shared until either board writes to them.
+        """
+        other = type(self).__new__(type(self))
+        other.width = self.width
+        other.height = self.height
+        other.tile_size = self.tile_size
+        other._tiles = dict(self._tiles)
+        other._tile_counts = dict(self._tile_counts)
+        other._owned = set()
+        self._owned = set()
+        other._fruit_lines = self._fruit_lines
+        other._fruit_tiles = self._fruit_tiles
+        other._n_fruit_cells = self._n_fruit_cells
+        other._fruits_shared = self._fruits_shared = True
+        return other
+
+    def _unshare_fruits(self):
+        if self._fruits_shared:
+            self._fruit_lines = {
+                line: dict(fruits) for line, fruits in self._fruit_lines.items()
+            }
+            self._fruit_tiles = {
+                key: dict(fruits) for key, fruits in self._fruit_tiles.items()
+            }
+            self._fruits_shared = False
+
+    def _writable_tile(self, key):
+        tile = self._tiles[key]
+        if key not in self._owned:
+            tile = tile.copy()
+            self._tiles[key] = tile
+            self._owned.add(key)
+        return tile
+
+    def add_snake_cell(self, x, y):
+        key, offset = self._locate(x, y)
+        if key in self._tiles:
+            tile = self._writable_tile(key)
+        else:
+            tile = np.zeros((self.tile_size, self.tile_size), dtype=np.uint16)
+            self._tiles[key] = tile
+            self._tile_counts[key] = 0
+            self._owned.add(key)
+        tile[offset] += 1
+        self._tile_counts[key] += 1
+
+    def remove_snake_cell(self, x, y):
+        key, offset = self._locate(x, y)
+        tile = self._writable_tile(key)
+        tile[offset] -= 1
+        self._tile_counts[key] -= 1
+        if not self._tile_counts[key]:
+            del self._tiles[key]
+            del self._tile_counts[key]
+            self._owned.discard(key)
+
+    def snake_count(self, x, y):
+        key, offset = self._locate(x, y)
+        tile = self._tiles.get(key)
+        if tile is None:
+            return 0
+        return int(tile[offset])
+
+    def is_occupied(self, x, y):
+        return self.snake_count(x, y) > 0
+
+    def add_fruit(self, x, y):
+        self._unshare_fruits()
+        key, _ = self._locate(x, y)
+        for index, bucket in [(self._fruit_tiles, key)] + [
+            (self._fruit_lines, line) for line in _line_keys(x, y)
+        ]:
+            fruits = index.setdefault(bucket, {})
+            fruits[(x, y)] = fruits.get((x, y), 0) + 1
+        if self._fruit_tiles[key][(x, y)] == 1:
+            self._n_fruit_cells += 1
+
+    def remove_fruit(self, x, y):
+        self._unshare_fruits()
+        key, _ = self._locate(x, y)
+        for index, bucket in [(self._fruit_tiles, key)] + [
+            (self._fruit_lines, line) for line in _line_keys(x, y)
+        ]:
+            fruits = index[bucket]
+            fruits[(x, y)] -= 1
+            if not fruits[(x, y)]:
+                del fruits[(x, y)]
+            if not fruits:
+                del index[bucket]
+        if (x, y) not in self._fruit_tiles.get(key, ()):
+            self._n_fruit_cells -= 1
+
+    def has_fruit(self, x, y):
+        return (x, y) in self._fruit_lines.get(("row", y), ())
+
+    def clear_fruits(self):
+        self._fruit_lines = {}
+        self._fruit_tiles = {}
+        self._n_fruit_cells = 0
+        self._fruits_shared = False
+
+    def _tile_ring(self, tx, ty, radius):
+        """Keys of all tiles at Chebyshev distance `radius` from (tx, ty)"""
+        if radius == 0:
+            yield tx, ty
+            return
+        for i in range(-radius, radius + 1):
+            yield tx + i, ty - radius
+            yield tx + i, ty + radius
+        for j in range(-radius + 1, radius):
+            yield tx - radius, ty + j
+            yield tx + radius, ty + j
+
+    def nearest_fruit_distance(self, x, y):
+        """
+        Manhattan distance from (x, y) to the closest fruit.
+        The fruit tiles are searched in rings around the tile of (x, y),
+        so only buckets close to the query are visited.
+        Returns None if there are no fruits.
+
+        Examples:
+            >>> board = ChunkedBoard(1000, 1000)
+            >>> board.add_fruit(10, 10)
+            >>> board.add_fruit(900, 5)
+            >>> board.nearest_fruit_distance(800, 800)
+            895
+        """
+        if not self._n_fruit_cells:
+            return None
+
+        if self._n_fruit_cells <= BRUTE_FORCE_FRUITS:
+            return min(
+                abs(fx - x) + abs(fy - y)
+                for fruits in self._fruit_tiles.values()
+                for fx, fy in fruits
+            )
+
+        (tx, ty), _ = self._locate(x, y)
+        best = None
+        n_left = self._n_fruit_cells
+        for radius in count():
+            # Cells in this ring are at least this far away
+            if best is not None and best <= (radius - 1) * self.tile_size + 1:
+                break
+            for key in self._tile_ring(tx, ty, radius):
+                fruits = self._fruit_tiles.get(key)
+                if not fruits:
+                    continue
+                n_left -= len(fruits)
+                for fx, fy in fruits:
+                    dist = abs(fx - x) + abs(fy - y)
+                    if best is None or dist < best:
+                        best = dist
+            if not n_left:
+                break
+        return best
+
+    def fruit_ahead(self, x, y, direction):
+        """
+        Check whether a fruit lies on the ray starting next to (x, y)
+        and pointing in `direction`.
+
+        Examples:
+            >>> board = ChunkedBoard(10, 10)
+            >>> board.add_fruit(5, 2)
+            >>> board.fruit_ahead(5, 7, Direction.NORTH)
+            True
+            >>> board.fruit_ahead(2, 5, Direction.NORTHEAST)
+            True
+            >>> board.fruit_ahead(5, 7, Direction.SOUTH)
+            False
+        """
+        dx, dy = RAY_STEPS[direction]
+        for fx, fy in self._fruit_lines.get(_ray_line(x, y, direction), ()):
+            if not (0 <= fx < self.width and 0 <= fy < self.height):
+                continue
+            if dx and (fx - x) * dx <= 0:
+                continue
+            if dy and (fy - y) * dy <= 0:
+                continue
+            return True
+        return False
+
+    def occupancy(self, pad=0):
+        """
+        Dense boolean raster of the snake cells inside the board,
+        surrounded by `pad` empty cells on every side
+        """
+        raster = np.zeros((self.height + 2 * pad, self.width + 2 * pad), dtype=bool)
+        size = self.tile_size
+        for (tx, ty), tile in self._tiles.items():
+            ox, oy = tx * size, ty * size
+            x0, y0 = max(ox, 0), max(oy, 0)
+            x1, y1 = min(ox + size, self.width), min(oy + size, self.height)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            raster[y0 + pad : y1 + pad, x0 + pad : x1 + pad] = (
+                tile[y0 - oy : y1 - oy, x0 - ox : x1 - ox] > 0
+            )
+        return raster
+
+    def fruit_cells(self):
+        """(n, 2) array of the cells with fruits inside the board"""
+        cells = np.array(
+            [cell for fruits in self._fruit_tiles.values() for cell in fruits],
+            dtype=int,
+        ).reshape(-1, 2)
+        x, y = cells[:, 0], cells[:, 1]
+        return cells[(0 <= x) & (x < self.width) & (0 <= y) & (y < self.height)]
+
+    def sense_all(self, heads, border=False):
+        """
+        Sensor readings of many heads inside the board at once.
+
+        Returns an (n, 8, 2) array with the rays in the order of `RAY_STEPS`,
+        [:, :, 0] tells whether a fruit lies on the ray and [:, :, 1] whether
+        the next cell is a snake or, with `border`, the wall.
+        The snake cells are rasterized once, and the fruits are sorted once
+        per line type by line and position, so that the prefix counts of
+        the fruits on every row, column and diagonal are binary searches
+        instead of walks over the fruits of each line.
+
+        Examples:
+            >>> board = ChunkedBoard(10, 10)
+            >>> board.add_fruit(5, 2)
+            >>> board.add_snake_cell(3, 3)
+            >>> readings = board.sense_all([(5, 7), (2, 5), (2, 2)])
+            >>> readings[:, :, 0].argmax(axis=1).tolist()
+            [0, 1, 2]
+            >>> readings[:, :, 0].sum().tolist()
+            3.0
+            >>> readings[2, :, 1].astype(int).tolist()
+            [0, 0, 0, 1, 0, 0, 0, 0]
+        """
+        heads = np.asarray(heads, dtype=int).reshape(-1, 2)
+        x, y = heads[:, 0], heads[:, 1]
+        readings = np.zeros((len(heads), 8, 2))
+
+        raster = self.occupancy(pad=1)
+        if border:
+            raster[[0, -1], :] = True
+            raster[:, [0, -1]] = True
+        readings[:, :, 1] = raster[y[:, None] + RAY_DY + 1, x[:, None] + RAY_DX + 1]
+
+        fruits = self.fruit_cells()
+        if not len(fruits):
+            return readings
+        fx, fy = fruits[:, 0], fruits[:, 1]
+        stride = max(self.width, self.height) + 1
+        # Line and position along the line of the fruits and the heads, and
+        # the rays looking back and forth along the line
+        fruit_diag, diag = fx - fy + self.height, x - y + self.height
+        lines = [
+            (fy, fx, y, x, Direction.WEST, Direction.EAST),
+            (fx, fy, x, y, Direction.NORTH, Direction.SOUTH),
+            (fruit_diag, fy, diag, y, Direction.NORTHWEST, Direction.SOUTHEAST),
+            (fx + fy, fy, x + y, y, Direction.NORTHEAST, Direction.SOUTHWEST),
+        ]
+        for fruit_line, fruit_pos, line, pos, back, forth in lines:
+            # Sorted keys of all fruits: the number of keys below the key of
+            # a cell is the prefix count of the fruits up to it on its line
+            keys = np.sort(fruit_line * stride + fruit_pos)
+            key = line * stride + pos
+            line_start = np.searchsorted(keys, key - pos)
+            line_end = np.searchsorted(keys, key - pos + stride)
+            readings[:, RAY_INDEX[back], 0] = np.searchsorted(keys, key) > line_start
+            readings[:, RAY_INDEX[forth], 0] = line_end > np.searchsorted(
+                keys, key, side="right"
+            )
+        return readings
@@ -0,0 +1,58 @@
+"""Atomic checkpoints for resuming interrupted optimizations"""
+import logging
+import os
+import pickle
+import random
+import tempfile
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def save(path, state):
+    """
+    Pickle `state` to `path`.
+    The checkpoint is written to a temporary file next to `path` first and
+    then moved over it, so an interruption never leaves a broken checkpoint.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".checkpoint-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    logger.debug("Saved checkpoint to %s", path)
+
+
+def load(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def exists(path):
+    return bool(path) and os.path.exists(path)
+
+
+def random_states():
+    """
+    States of the global random number generators.
+
+    Examples:
+        >>> state = random_states()
+        >>> a = np.random.rand(), random.random()
+        >>> restore_random_states(state)
+        >>> a == (np.random.rand(), random.random())
+        True
+    """
+    return {"np_random": np.random.get_state(), "random": random.getstate()}
+
+
+def restore_random_states(state):
+    np.random.set_state(state["np_random"])
+    random.setstate(state["random"])
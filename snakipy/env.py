@@ -0,0 +1,140 @@
+"""Batched environment API for external agents"""
+import logging
+
+import numpy as np
+
+from snakipy.game import Game
+from snakipy.snake import Direction, Snake, relative_direction
+
+logger = logging.getLogger(__name__)
+
+
+OBSERVATION_SIZE = 16
+N_ACTIONS = 3
+
+
+class VectorEnv:
+    """
+    Steps `n_envs` independent single-snake games in lockstep.
+
+    Observations are the flattened `Game.reduced_coordinates` of each snake.
+    Actions are relative turns as used by `NeuroSnake`:
+    0 turns left, 1 goes straight and 2 turns right.
+    Finished games are replaced by fresh ones right away, so the returned
+    observation of a finished game already belongs to its successor.
+    A game whose snake died has no observation after its last step, so its
+    `final_observation` is all zeros and `terminated` is set. Games cut off
+    after `max_steps` keep their last observation.
+
+    All arrays returned by `reset` and `step` are preallocated buffers
+    which are overwritten by the next call. Copy them if you need to keep them.
+
+    Examples:
+        >>> env = VectorEnv(4, width=10, seed=0)
+        >>> env.reset().shape
+        (4, 16)
+        >>> obs, rewards, dones, infos = env.step(np.ones(4, dtype=int))
+        >>> rewards.shape, dones.dtype, sorted(infos)
+        ((4,), dtype('bool'), ['final_observation', 'length', 'score', 'terminated'])
+        >>> while not dones.all():
+        ...     obs, rewards, dones, infos = env.step(np.ones(4, dtype=int))
+        >>> infos["terminated"].tolist(), bool(infos["final_observation"].any())
+        ([True, True, True, True], False)
+    """
+
+    def __init__(
+        self, n_envs, width=20, height=None, max_steps=1000, seed=None, **game_options
+    ):
+        self.n_envs = n_envs
+        self.width = width
+        self.height = height if height else width
+        self.max_steps = max_steps
+        self.game_options = game_options
+        self.rng = np.random.RandomState(seed)
+        self.games = [None] * n_envs
+
+        self.observations = np.zeros((n_envs, OBSERVATION_SIZE))
+        self.rewards = np.zeros(n_envs)
+        self.dones = np.zeros(n_envs, dtype=bool)
+        self.infos = {
+            "score": np.zeros(n_envs),
+            "length": np.zeros(n_envs, dtype=int),
+            "final_observation": np.zeros((n_envs, OBSERVATION_SIZE)),
+            "terminated": np.zeros(n_envs, dtype=bool),
+        }
+        self._scores = np.zeros(n_envs)
+        self._steps = np.zeros(n_envs, dtype=int)
+
+    def _new_game(self, idx):
+        snake = Snake.new_snake(
+            self.width // 2,
+            self.height // 2,
+            self.width,
+            self.height,
+            direction=Direction.SOUTH,
+        )
+        game = Game(
+            self.width,
+            self.height,
+            player_snake=snake,
+            seed=self.rng.randint(2 ** 31),
+            **self.game_options,
+        )
+        self.games[idx] = game
+        self._scores[idx] = 0
+        self._steps[idx] = 0
+        self._observe(idx)
+
+    def _observe(self, idx):
+        game = self.games[idx]
+        self.observations[idx] = game.reduced_coordinates(game.snakes[0]).ravel()
+
+    def reset(self):
+        for idx in range(self.n_envs):
+            self._new_game(idx)
+        self.rewards[:] = 0
+        self.dones[:] = False
+        return self.observations
+
+    def step(self, actions):
+        """
+        Apply one action per game.
+
+        Returns
+        -------
+        observations : (n_envs, 16) array
+        rewards : (n_envs,) array
+            Change of the score during this step
+        dones : (n_envs,) bool array
+        infos : dict of arrays
+            `score`, `length`, `final_observation` and `terminated` of the
+            games which finished in this step. Entries of unfinished games
+            are left untouched.
+        """
+        for idx, (game, action) in enumerate(zip(self.games, actions)):
+            snake = game.snakes[0]
+            game.step([relative_direction(snake.direction, int(action))])
+            self._steps[idx] += 1
+
+            (score,) = game.rewards
+            self.rewards[idx] = score - self._scores[idx]
+            self._scores[idx] = score
+
+            alive = bool(game.snakes)
+            if alive:
+                self._observe(idx)
+            done = not alive or self._steps[idx] >= self.max_steps
+            self.dones[idx] = done
+
+            if done:
+                logger.debug("Game %s finished with score %s", idx, score)
+                self.infos["score"][idx] = score
+                self.infos["length"][idx] = self._steps[idx]
+                if alive:
+                    self.infos["final_observation"][idx] = self.observations[idx]
+                else:
+                    self.infos["final_observation"][idx] = 0
+                self.infos["terminated"][idx] = not alive
+                self._new_game(idx)
+
+        return self.observations, self.rewards, self.dones, self.infos
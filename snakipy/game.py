@@ -1,12 +1,15 @@
+import copy
 import curses
 from enum import Enum, auto
 import logging
 from dataclasses import dataclass, field
 from itertools import islice, count
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 import numpy as np
 
+from snakipy import trace
+from snakipy.board import MAX_RASTER_CELLS, ChunkedBoard
 from snakipy.snake import Direction, NeuroSnake, Snake
 
 logger = logging.getLogger(__name__)
@@ -35,6 +38,25 @@ class BoardState(Enum):
 FRUIT_REWARD = 10
 DEATH_REWARD = -50
 DISTANCE_REWARD = 0.4
+# Sensing the deciding snakes in one batch pays a fixed cost per step for
+# the raster and the fruit sorting. It wins over sensing them one by one from
+# this number of snakes on, plus one snake per this many board cells.
+SENSE_ALL_MIN_SNAKES = 5
+SENSE_ALL_CELLS_PER_SNAKE = 300_000
+
+
+@dataclass(frozen=True)
+class GameState:
+    """Snapshot of everything that changes while a game is running"""
+
+    snakes: Tuple[Snake, ...]
+    slots: Tuple[int, ...]
+    fruits: Tuple[Tuple[int, int], ...]
+    board: ChunkedBoard
+    rewards: Tuple[float, ...]
+    closest_distance: Tuple[Optional[int], ...]
+    rng: np.random.RandomState
+    n_steps: int
 
 
 @dataclass
@@ -55,6 +77,7 @@ class Game:
 
     def __post_init__(self):
         self.fruits = []
+        self.board = ChunkedBoard(self.width, self.height)
 
         if self.snakes is None and self.player_snake is None:
             raise ValueError("There are no snakes!")
@@ -62,43 +85,134 @@ class Game:
             self.snakes.append(self.player_snake)
         self.rewards = [0 for s in self.snakes]
         self.closest_distance = [None for _ in self.snakes]
+        # Maps the position of each living snake to its reward slot
+        self._slots = list(range(len(self.snakes)))
+        self.n_steps = 0
+        self.remove_dead_snakes()
+        for snake in self.snakes:
+            self.add_to_board(snake)
         self.rng = np.random.RandomState(self.seed)
+        # Set while the random state is shared with a snapshot
+        self._rng_shared = False
         self.update_fruits()
 
     def __iter__(self):
-        game_over = False
-
-        for _ in islice(count(), self.number_of_steps):
+        for step in islice(count(), self.number_of_steps):
             direction = yield
-            logger.debug("New direction: %s", direction)
+            if trace.ENABLED:
+                trace.emit(trace.STEP, step)
 
-            new_snakes = []
-            for idx, snake in enumerate(self.snakes):
-                if not isinstance(snake, NeuroSnake):
-                    continue
+            self.step()
 
-                if snake.game_over:
-                    continue
+            if not self.snakes:
+                break
 
-                coords = self.reduced_coordinates(snake).flatten()
+    def step(self, directions=None):
+        """
+        Advance the game by one step.
+
+        Parameters
+        ----------
+        directions : list, optional
+            One direction per living snake, in the order of `snakes`.
+            A NeuroSnake without a given direction decides on its own,
+            any other snake keeps its heading.
+        """
+        if directions is None:
+            directions = [None] * len(self.snakes)
+
+        deciding = [
+            snake
+            for snake, direction in zip(self.snakes, directions)
+            if direction is None and isinstance(snake, NeuroSnake)
+        ]
+        views = None
+        area = self.width * self.height
+        if len(deciding) >= SENSE_ALL_MIN_SNAKES + area // SENSE_ALL_CELLS_PER_SNAKE:
+            views = iter(self.sense_all(deciding))
+
+        new_snakes = []
+        for snake, direction in zip(self.snakes, directions):
+            if direction is None and isinstance(snake, NeuroSnake):
+                if views is None:
+                    coords = self.reduced_coordinates(snake).flatten()
+                else:
+                    coords = next(views)
                 # self.punish_circles(snake, direction)
                 direction = snake.decide_direction(coords)
-                new_snakes.append(snake.update(direction))
+            new_snakes.append(snake.update(direction))
 
-            self.snakes = self.check_collision(new_snakes)
+        self.update_board(self.snakes, new_snakes)
+        self.snakes = self.check_collision(new_snakes)
 
-            if not self.snakes:
-                game_over = True
-            self.update_fruits()
-            self.update_distances()
+        self.update_fruits()
+        self.update_distances()
+        self.remove_dead_snakes()
+        self.n_steps += 1
 
-            if game_over:
-                break
+    def snapshot(self):
+        """
+        Capture the current state for a later `restore`.
+        Snakes are never modified after the step that created them,
+        so they are shared instead of copied. The board and the random
+        number generator are only copied once they are about to change.
+        """
+        self._rng_shared = True
+        return GameState(
+            snakes=tuple(self.snakes),
+            slots=tuple(self._slots),
+            fruits=tuple(self.fruits),
+            board=self.board.copy(),
+            rewards=tuple(self.rewards),
+            closest_distance=tuple(self.closest_distance),
+            rng=self.rng,
+            n_steps=self.n_steps,
+        )
+
+    def restore(self, state):
+        """Reset the game to a state taken with `snapshot`"""
+        self.snakes = list(state.snakes)
+        self._slots = list(state.slots)
+        self.fruits = list(state.fruits)
+        self.board = state.board.copy()
+        self.rewards = list(state.rewards)
+        self.closest_distance = list(state.closest_distance)
+        self.rng = state.rng
+        self._rng_shared = True
+        self.n_steps = state.n_steps
+
+    def clone(self):
+        """Independent copy of the game which shares all unchanged data"""
+        other = copy.copy(self)
+        other.restore(self.snapshot())
+        return other
+
+    def position_of(self, slot):
+        """Index in `snakes` of the living snake with reward slot `slot`, or None"""
+        try:
+            return self._slots.index(slot)
+        except ValueError:
+            return None
+
+    def snake_in_slot(self, slot):
+        """The living snake with reward slot `slot`, or None"""
+        idx = self.position_of(slot)
+        return None if idx is None else self.snakes[idx]
+
+    def remove_dead_snakes(self):
+        """Drop dead snakes so that they no longer take part in any step."""
+        alive = [
+            (slot, snake)
+            for slot, snake in zip(self._slots, self.snakes)
+            if not snake.game_over
+        ]
+        self._slots = [slot for slot, _ in alive]
+        self.snakes = [snake for _, snake in alive]
 
     def punish_circles(self, snake, new_direction):
         dir_list = [Direction.NORTH, Direction.EAST, Direction.SOUTH, Direction.WEST]
         dir_idx = dir_list.index(snake.direction)
-        snake_idx = self.snakes.index(snake)
+        snake_idx = self._slots[self.snakes.index(snake)]
         i1 = (dir_idx + 1) % 4
         i2 = (dir_idx - 1) % 4
         if dir_list[i1] == new_direction or dir_list[i2] == new_direction:
@@ -106,6 +220,9 @@ class Game:
 
     def update_fruits(self):
         """Add fruits to the game until max_number_of_fruits is reached."""
+        if self._rng_shared and len(self.fruits) < self.max_number_of_fruits:
+            self.rng = copy.copy(self.rng)
+            self._rng_shared = False
         while len(self.fruits) < self.max_number_of_fruits:
             new_x, new_y = (
                 self.rng.randint(0, self.width - 1),
@@ -115,15 +232,39 @@ class Game:
 
     def add_fruit(self, x, y):
         self.fruits.append((x, y))
+        self.board.add_fruit(x, y)
+
+    def remove_fruit(self, x, y):
+        self.fruits.remove((x, y))
+        self.board.remove_fruit(x, y)
 
     def clear_fruits(self):
         self.fruits = []
+        self.board.clear_fruits()
+
+    def add_to_board(self, snake):
+        for x, y in snake.coordinates:
+            self.board.add_snake_cell(x, y)
+
+    def remove_from_board(self, snake):
+        for x, y in snake.coordinates:
+            self.board.remove_snake_cell(x, y)
+
+    def update_board(self, old_snakes, new_snakes):
+        """
+        Move the snakes on the board index.
+        Only the cells a snake enters or leaves are touched.
+        """
+        for old, new in zip(old_snakes, new_snakes):
+            n_removed = len(old.coordinates) + 1 - len(new.coordinates)
+            for x, y in old.coordinates[:n_removed]:
+                self.board.remove_snake_cell(x, y)
+            self.board.add_snake_cell(*new.head)
 
     def update_distances(self):
         new_distances = self.determine_fruit_distances()
-        for idx, (old_dist, new_dist) in enumerate(
-            zip(self.closest_distance, new_distances)
-        ):
+        for idx, new_dist in zip(self._slots, new_distances):
+            old_dist = self.closest_distance[idx]
             if old_dist is None:
                 self.closest_distance[idx] = new_dist
                 continue
@@ -139,8 +280,7 @@ class Game:
             return [0 for _ in self.snakes]
 
         return [
-            min([self.fruit_distance(snake, fruit) for fruit in self.fruits])
-            for snake in self.snakes
+            self.board.nearest_fruit_distance(*snake.head) for snake in self.snakes
         ]
 
     @staticmethod
@@ -150,31 +290,30 @@ class Game:
         return abs(x - xf) + abs(y - yf)
 
     def check_collision(self, new_snakes):
-        board = {}
-        heads = {}
-
-        for i, snk in enumerate(new_snakes):
+        """
+        Expects the board index to already contain the moved snakes.
+        A snake dies if its head leaves the board or shares its cell
+        with any other snake element.
+        """
+        for i, snk in zip(self._slots, new_snakes):
             hx, hy = snk.head
 
             if any((hx < 0, hx >= self.width, hy < 0, hy >= self.height)):
                 self.rewards[i] += DEATH_REWARD
                 snk.game_over = True
 
-            if (hx, hy) in self.fruits:
-                self.fruits.remove((hx, hy))
+            if self.board.has_fruit(hx, hy):
+                self.remove_fruit(hx, hy)
                 self.rewards[i] += FRUIT_REWARD
                 snk.length += 1
 
-            heads.setdefault((hx, hy), []).append(i)
-            for x, y in snk.coordinates:
-                board[(x, y)] = board.get((x, y), 0) + 1
+            if self.board.snake_count(hx, hy) > 1:
+                self.rewards[i] += DEATH_REWARD
+                snk.game_over = True
 
-        for pos, count in board.items():
-            if count > 1:
-                indices = heads[pos]
-                for idx in indices:
-                    self.rewards[idx] += DEATH_REWARD
-                    new_snakes[idx].game_over = True
+        for snk in new_snakes:
+            if snk.game_over:
+                self.remove_from_board(snk)
 
         return new_snakes
 
@@ -182,65 +321,10 @@ class Game:
         if self.border:
             if coord[0] in (-1, self.width) or coord[1] in (-1, self.height):
                 return True
-        for snake in self.snakes:
-            if coord in snake.coordinates:
-                return True
-        return False
+        return self.board.is_occupied(*coord)
 
     def fruit_ahead(self, coord, direction):
-        head_x, head_y = coord
-
-        # look north
-        if direction == Direction.NORTH:
-            for y in reversed(range(head_y)):
-                if (head_x, y) in self.fruits:
-                    return True
-
-        # look north-east
-        if direction == Direction.NORTHEAST:
-            for x, y in zip(range(head_x + 1, self.width), reversed(range(head_y))):
-                if (x, y) in self.fruits:
-                    return True
-
-        # look east
-        if direction == Direction.EAST:
-            for x in range(head_x + 1, self.width):
-                if (x, head_y) in self.fruits:
-                    return True
-
-        # look south-east
-        if direction == Direction.SOUTHEAST:
-            for x, y in zip(
-                range(head_x + 1, self.width), range(head_y + 1, self.height)
-            ):
-                if (x, y) in self.fruits:
-                    return True
-
-        # look south
-        if direction == Direction.SOUTH:
-            for y in range(head_y + 1, self.height):
-                if (head_x, y) in self.fruits:
-                    return True
-
-        # look south-west
-        if direction == Direction.SOUTHWEST:
-            for x, y in zip(reversed(range(head_x)), range(head_y + 1, self.height)):
-                if (x, y) in self.fruits:
-                    return True
-
-        # look west
-        if direction == Direction.WEST:
-            for x in reversed(range(head_x)):
-                if (x, head_y) in self.fruits:
-                    return True
-
-        # look north-west
-        if direction == Direction.NORTHWEST:
-            for x, y in zip(reversed(range(head_x)), reversed(range(head_y))):
-                if (x, y) in self.fruits:
-                    return True
-
-        return False
+        return self.board.fruit_ahead(*coord, direction)
 
     def reduced_coordinates(self, snake):
         """
@@ -261,68 +345,89 @@ class Game:
 
         # look north
         if self.is_wall_or_snake((head_x, head_y - 1)):
-            logger.debug("Wall at north")
             result[0, 1] = 1
         if self.fruit_ahead((head_x, head_y), Direction.NORTH):
-            logger.debug("Fruit at north")
             result[0, 0] = 1
 
         # look north-east
         if self.is_wall_or_snake((head_x + 1, head_y - 1)):
-            logger.debug("Wall at north-east")
             result[1, 1] = 1
         if self.fruit_ahead((head_x, head_y), Direction.NORTHEAST):
-            logger.debug("Fruit at north-east")
             result[1, 0] = 1
 
         # look east
         if self.is_wall_or_snake((head_x + 1, head_y)):
-            logger.debug("Wall at east")
             result[2, 1] = 1
         if self.fruit_ahead((head_x, head_y), Direction.EAST):
-            logger.debug("Fruit at east")
             result[2, 0] = 1
 
         # look south-east
         if self.is_wall_or_snake((head_x + 1, head_y + 1)):
-            logger.debug("Wall at south-east")
             result[3, 1] = 1
         if self.fruit_ahead((head_x, head_y), Direction.SOUTHEAST):
-            logger.debug("Fruit at south-east")
             result[3, 0] = 1
 
         # look south
         if self.is_wall_or_snake((head_x, head_y + 1)):
-            logger.debug("Wall at south")
             result[4, 1] = 1
         if self.fruit_ahead((head_x, head_y), Direction.SOUTH):
-            logger.debug("Wall at south")
             result[4, 0] = 1
 
         # look south-west
         if self.is_wall_or_snake((head_x - 1, head_y + 1)):
-            logger.debug("Wall at south-west")
             result[5, 1] = 1
         if self.fruit_ahead((head_x, head_y), Direction.SOUTHWEST):
-            logger.debug("Fruit at south-west")
             result[5, 0] = 1
 
         # look west
         if self.is_wall_or_snake((head_x - 1, head_y)):
-            logger.debug("Wall at west")
             result[6, 1] = 1
         if self.fruit_ahead((head_x, head_y), Direction.WEST):
-            logger.debug("Fruit at west")
             result[6, 0] = 1
 
         # look north-west
         if self.is_wall_or_snake((head_x - 1, head_y - 1)):
-            logger.debug("Wall at north-west")
             result[7, 1] = 1
         if self.fruit_ahead((head_x, head_y), Direction.NORTHWEST):
-            logger.debug("Fruit at north-west")
             result[7, 0] = 1
 
         direction_idx = direction.value
         result = np.roll(result, Direction.NORTH.value - direction_idx, axis=0)
+        if trace.ENABLED:
+            trace.emit(trace.SENSORS, head_x, head_y, trace.pack_flags(result))
         return result
+
+    def sense_all(self, snakes=None):
+        """
+        Observations of many snakes at once, as an (n_snakes, 16) array.
+        Row i equals `reduced_coordinates(snakes[i]).flatten()`, but the
+        board is rasterized and its fruit lines are counted only once for
+        all snakes. Boards too large for a raster, and heads outside the
+        board, fall back to sensing the snakes one by one.
+
+        Parameters
+        ----------
+        snakes : list of Snake, optional
+            Defaults to all living snakes
+        """
+        if snakes is None:
+            snakes = self.snakes
+        heads = np.array([snake.head for snake in snakes], dtype=int).reshape(-1, 2)
+        x, y = heads[:, 0], heads[:, 1]
+        if self.width * self.height > MAX_RASTER_CELLS or not np.all(
+            (0 <= x) & (x < self.width) & (0 <= y) & (y < self.height)
+        ):
+            return np.array(
+                [self.reduced_coordinates(snake).flatten() for snake in snakes]
+            ).reshape(-1, 16)
+
+        readings = self.board.sense_all(heads, self.border)
+        # Same rotation as the np.roll in `reduced_coordinates`
+        turns = np.array([snake.direction.value for snake in snakes])
+        rays = (np.arange(8) + turns[:, None] - Direction.NORTH.value) % 8
+        readings = np.take_along_axis(readings, rays[:, :, None], axis=1)
+        if trace.ENABLED:
+            trace.emit_many(
+                trace.SENSORS, x.tolist(), y.tolist(), trace.pack_flag_rows(readings)
+            )
+        return readings.reshape(-1, 16)
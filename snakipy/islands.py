@@ -0,0 +1,271 @@
+"""Island model: populations evolving in separate processes with migration"""
+import ipaddress
+import logging
+import multiprocessing
+import random
+import time
+from multiprocessing.connection import Client, Listener, wait
+
+import fire
+import numpy as np
+
+from snakipy.optimize import create_snakes, evaluate_population, evolve
+
+logger = logging.getLogger(__name__)
+
+
+# Only used on the loopback interface, see `resolve_authkey`
+AUTHKEY = b"snakipy"
+
+
+def is_loopback(host):
+    """
+    Examples:
+        >>> is_loopback("127.0.0.1"), is_loopback("localhost"), is_loopback("0.0.0.0")
+        (True, True, False)
+    """
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def resolve_authkey(host, authkey=None):
+    """
+    The key the coordinator and the islands authenticate each other with.
+    Connections unpickle whatever the peer sends, so anything that is not
+    restricted to the loopback interface needs an explicit secret key.
+    """
+    if authkey is None:
+        if not is_loopback(host):
+            raise ValueError(f"An authkey is required for connections on {host}")
+        return AUTHKEY
+    if isinstance(authkey, bytes):
+        return authkey
+    return str(authkey).encode()
+
+
+def migration_sources(topology, n_islands):
+    """
+    Map every island to the islands it receives migrants from.
+
+    Examples:
+        >>> migration_sources("ring", 3)
+        {0: [2], 1: [0], 2: [1]}
+        >>> migration_sources("full", 3)
+        {0: [1, 2], 1: [0, 2], 2: [0, 1]}
+    """
+    if topology == "ring":
+        return {i: [(i - 1) % n_islands] for i in range(n_islands)}
+    if topology == "full":
+        return {i: [j for j in range(n_islands) if j != i] for i in range(n_islands)}
+    if topology == "none":
+        return {i: [] for i in range(n_islands)}
+    raise ValueError(f"Unknown topology {topology}")
+
+
+def run_island(host="127.0.0.1", port=6000, island_id=0, authkey=None):
+    """
+    Evolve one population and exchange migrants through the coordinator.
+    Can be started on any node that reaches the coordinator.
+    """
+    conn = Client((host, port), authkey=resolve_authkey(host, authkey))
+    conn.send(("hello", island_id))
+    config = conn.recv()
+
+    if config["seed"] is None:
+        # Forked islands inherit the random state of the parent
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+    else:
+        seed = config["seed"] + island_id
+    random.seed(seed)
+    np.random.seed(seed)
+
+    size, nx, ny = config["size"], config["nx"], config["ny"]
+    snakes = create_snakes(size, nx, ny)
+
+    for generation in range(config["n_generations"]):
+        start = time.perf_counter()
+        scores = evaluate_population(
+            snakes, size, config["n_batch"], config["n_steps"], progress=False
+        )
+        dnas = [snk.dna for snk in snakes]
+        conn.send(
+            (
+                "stats",
+                generation,
+                {
+                    "median": float(np.median(scores)),
+                    "mean": float(np.mean(scores)),
+                    "top": float(np.max(scores)),
+                    "seconds": time.perf_counter() - start,
+                },
+            )
+        )
+
+        if (generation + 1) % config["migration_interval"] == 0:
+            order = np.argsort(scores)[::-1]
+            best = order[: config["n_migrants"]]
+            conn.send(("migrants", [dnas[i] for i in best], scores[best].tolist()))
+            immigrants, immigrant_scores = conn.recv()
+            # Immigrants replace the worst individuals
+            scores = scores.copy()
+            for idx, dna, score in zip(order[::-1], immigrants, immigrant_scores):
+                dnas[idx] = dna
+                scores[idx] = score
+
+        best = int(np.argmax(scores))
+        new_dnas = evolve(dnas, scores)
+        snakes = create_snakes(size, nx, ny, dnas=new_dnas)
+
+    conn.send(("done", dnas[best], float(scores[best])))
+    conn.close()
+
+
+class Coordinator:
+    """
+    Accepts island connections, routes migrants according to the
+    topology and collects per-island statistics.
+    """
+
+    def __init__(
+        self,
+        n_islands,
+        topology="ring",
+        host="127.0.0.1",
+        port=0,
+        authkey=None,
+    ):
+        self.n_islands = n_islands
+        self.sources = migration_sources(topology, n_islands)
+        self.listener = Listener((host, port), authkey=resolve_authkey(host, authkey))
+        self.stats = {i: [] for i in range(n_islands)}
+        self.results = {}
+
+    @property
+    def address(self):
+        return self.listener.address
+
+    def _accept(self):
+        conns = {}
+        while len(conns) < self.n_islands:
+            conn = self.listener.accept()
+            _, island_id = conn.recv()
+            logger.info("Island %s connected", island_id)
+            conns[island_id] = conn
+        return conns
+
+    def run(self, config):
+        """Drive all islands until they are done. Returns the per-island results."""
+        conns = self._accept()
+        for conn in conns.values():
+            conn.send(config)
+
+        island_of = {conn: island_id for island_id, conn in conns.items()}
+        migrants = {}
+        active = set(conns.values())
+        while active:
+            for conn in wait(list(active)):
+                island_id = island_of[conn]
+                message = conn.recv()
+                kind = message[0]
+
+                if kind == "stats":
+                    _, generation, stats = message
+                    self.stats[island_id].append(stats)
+                    logger.info(
+                        "Island %s, generation %s: median %.2f, mean %.2f, top %.2f",
+                        island_id,
+                        generation,
+                        stats["median"],
+                        stats["mean"],
+                        stats["top"],
+                    )
+                elif kind == "migrants":
+                    migrants[island_id] = message[1:]
+                elif kind == "done":
+                    self.results[island_id] = message[1:]
+                    active.discard(conn)
+
+            # All islands migrate in the same generation, so wait for everybody
+            if migrants and len(migrants) == len(active):
+                for island_id, conn in conns.items():
+                    dnas, scores = [], []
+                    for source in self.sources[island_id]:
+                        dnas.extend(migrants[source][0])
+                        scores.extend(migrants[source][1])
+                    conn.send((dnas, scores))
+                migrants = {}
+
+        for conn in conns.values():
+            conn.close()
+        self.listener.close()
+        return self.results
+
+
+def island_evolution(
+    n_islands=4,
+    n_local=None,
+    topology="ring",
+    migration_interval=5,
+    n_migrants=2,
+    n_generations=100,
+    n_steps=500,
+    n_batch=10,
+    dnafile=None,
+    host="127.0.0.1",
+    port=0,
+    seed=None,
+    authkey=None,
+):
+    """
+    Run the coordinator and start `n_local` islands (default: all) as
+    local processes. Missing islands can join from other nodes with
+    `snake_islands worker --host ... --port ... --island_id ... --authkey ...`.
+    An `authkey` is required unless `host` is a loopback address.
+    """
+    logging.basicConfig(level=logging.INFO)
+    authkey = resolve_authkey(host, authkey)
+    coordinator = Coordinator(
+        n_islands, topology=topology, host=host, port=port, authkey=authkey
+    )
+    host, port = coordinator.address
+    logger.info("Coordinator listening on %s:%s", host, port)
+
+    n_local = n_islands if n_local is None else n_local
+    workers = [
+        multiprocessing.Process(
+            target=run_island, args=(host, port, island_id, authkey)
+        )
+        for island_id in range(n_local)
+    ]
+    for worker in workers:
+        worker.start()
+
+    config = {
+        "size": (80, 60),
+        "nx": 8,
+        "ny": 6,
+        "n_generations": n_generations,
+        "n_steps": n_steps,
+        "n_batch": n_batch,
+        "migration_interval": migration_interval,
+        "n_migrants": n_migrants,
+        "seed": seed,
+    }
+    results = coordinator.run(config)
+    for worker in workers:
+        worker.join()
+
+    best_island = max(results, key=lambda i: results[i][1])
+    best_dna, best_score = results[best_island]
+    logger.info("Best score %s from island %s", best_score, best_island)
+    if dnafile:
+        np.save(dnafile, best_dna)
+    return coordinator.stats
+
+
+def cli():
+    fire.Fire({"evolve": island_evolution, "worker": run_island})
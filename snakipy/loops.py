@@ -0,0 +1,109 @@
+"""Early termination of rollouts which have entered a loop"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LoopDetector:
+    """
+    Detects repeated game states.
+
+    As long as no fruit is eaten and no snake dies, a game of `NeuroSnake`s
+    is deterministic: the random number generator is only used to place
+    new fruits. So once the snakes, their directions and the fruits are
+    the same as at an earlier step, the game repeats the steps in between
+    forever.
+
+    The states since the last change of the fruits or the living snakes are
+    kept. When a rollout is stopped at a repeated state, `finish` either
+    adds the rewards the remaining steps would have given, which are known
+    from the recorded cycle, or adds `penalty` to every living snake.
+
+    Examples:
+        >>> from snakipy.game import Game
+        >>> from snakipy.snake import Direction, Snake
+        >>> def new_game():
+        ...     snake = Snake.new_snake(5, 5, 10, 10, Direction.EAST, periodic=True)
+        ...     return Game(10, 10, player_snake=snake, seed=1)
+        >>> game = new_game()
+        >>> play_out(game, 1000)
+        1000
+        >>> looping_game = new_game()
+        >>> detector = LoopDetector()
+        >>> play_out(looping_game, 1000, detector), detector.period
+        (12, 10)
+        >>> bool(abs(looping_game.rewards[0] - game.rewards[0]) < 1e-9)
+        True
+    """
+
+    def __init__(self, penalty=None):
+        self.penalty = penalty
+        self.period = None
+        self.skipped_steps = 0
+        self.reset()
+
+    def reset(self):
+        self._seen = {}
+        self._rewards = []
+        self._first = None
+        self._context = None
+
+    def update(self, game):
+        """Record the state after a step. Returns True if it occurred before."""
+        context = (tuple(game.fruits), tuple(game._slots))
+        if context != self._context:
+            self.reset()
+            self._context = context
+
+        key = tuple(
+            (tuple(snake.coordinates), snake.direction) for snake in game.snakes
+        )
+        first = self._seen.setdefault(key, len(self._rewards))
+        self._rewards.append(tuple(game.rewards))
+        if first == len(self._rewards) - 1:
+            return False
+        self._first = first
+        self.period = len(self._rewards) - 1 - first
+        return True
+
+    def finish(self, game, remaining_steps):
+        """Add the rewards of the `remaining_steps` steps which are skipped"""
+        self.skipped_steps += remaining_steps
+        if self.penalty is not None:
+            for slot in game._slots:
+                game.rewards[slot] += self.penalty
+            return
+
+        n_cycles, rest = divmod(remaining_steps, self.period)
+        start = self._rewards[self._first]
+        end = self._rewards[-1]
+        partial = self._rewards[self._first + rest]
+        game.rewards = [
+            reward + n_cycles * (e - s) + (p - s)
+            for reward, s, e, p in zip(game.rewards, start, end, partial)
+        ]
+
+
+def play_out(game, n_steps, detector=None):
+    """
+    Step `game` until all snakes are dead or `n_steps` steps are done.
+    With a `LoopDetector` the game stops at the first repeated state.
+    Returns the number of simulated steps.
+    """
+    if detector is not None:
+        detector.reset()
+    for step in range(n_steps):
+        game.step()
+        if not game.snakes:
+            return step + 1
+        if detector is not None and detector.update(game):
+            remaining = n_steps - step - 1
+            logger.debug(
+                "Loop of %s steps after step %s, skipping %s steps",
+                detector.period,
+                step,
+                remaining,
+            )
+            detector.finish(game, remaining)
+            return step + 1
+    return n_steps
@@ -3,9 +3,14 @@ import logging
 import fire
 import numpy as np
 
+from snakipy import trace
 from snakipy.game import Game
+from snakipy.neuro import NeuralNet, load_policy
 from snakipy.optimize import training
+from snakipy.render import render_game
+from snakipy.server import serve
 from snakipy.snake import NeuroSnake, Direction
+from snakipy.tournament import tournament
 from snakipy.ui import CursesUI, PygameUI
 
 
@@ -23,19 +28,27 @@ def main(
     fps=20,
     border=False,
     ui="curses",
+    trace_file=None,
 ):
     """Play the game"""
 
     UIClass = {"curses": CursesUI, "pygame": PygameUI}.get(ui.lower())
 
-    logging.basicConfig(level=logging.DEBUG, filename="snake.log", filemode="a")
+    logging.basicConfig(
+        level=logging.DEBUG if debug else logging.INFO,
+        filename="snake.log",
+        filemode="a",
+    )
+    if trace_file:
+        trace.enable(path=trace_file)
     if not height:
         height = width
+    input_size = 16
+    dna = net = None
     if dna_file:
         dna = np.load(dna_file)
-    else:
-        dna = None
-    input_size = 16
+        net = NeuralNet(input_size, hidden_size, 3, dna=dna)
+        load_policy(net, dna_file)
 
     game = Game(
         width,
@@ -48,6 +61,7 @@ def main(
             input_size=input_size,
             hidden_size=hidden_size,
             dna=dna,
+            net=net,
             direction=Direction.SOUTH,
         ),
         max_number_of_fruits=n_fruits,
@@ -59,7 +73,17 @@ def main(
     except StopIteration:
         print("Game Over")
         print("Score:", *game.rewards)
+    finally:
+        trace.disable()
 
 
 def cli():
-    fire.Fire({"main": main, "training": training})
+    fire.Fire(
+        {
+            "main": main,
+            "training": training,
+            "serve": serve,
+            "render": render_game,
+            "tournament": tournament,
+        }
+    )
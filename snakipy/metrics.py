@@ -0,0 +1,130 @@
+"""Streaming training metrics"""
+import csv
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+def score_summary(scores):
+    """
+    Distribution of the scores of one cycle.
+
+    Examples:
+        >>> score_summary([1, 2, 3, 4, 5])["median"]
+        3.0
+    """
+    if not len(scores):
+        return {key: float("nan") for key in score_summary([0])}
+    scores = np.asarray(scores, dtype=float)
+    p10, p25, median, p75, p90 = np.percentile(scores, [10, 25, 50, 75, 90])
+    return {
+        "min": float(scores.min()),
+        "p10": float(p10),
+        "p25": float(p25),
+        "median": float(median),
+        "p75": float(p75),
+        "p90": float(p90),
+        "max": float(scores.max()),
+        "mean": float(scores.mean()),
+        "std": float(scores.std()),
+    }
+
+
+class EvaluationStats:
+    """Counters collected between two metric records"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # Scores of played candidates, never surrogate predictions
+        self.scores = []
+        self.steps = 0
+        # Rollouts, i.e. games played by one candidate
+        self.evaluations = 0
+        # Wall time the caller spent waiting for evaluations
+        self.eval_seconds = 0.0
+        # Time spent evaluating, summed over all workers
+        self.busy_seconds = 0.0
+
+    def add(self, score, steps, seconds, evaluations=1):
+        self.scores.append(score)
+        self.steps += steps
+        self.evaluations += evaluations
+        self.busy_seconds += seconds
+
+
+class MetricsSink:
+    """
+    Appends one record per cycle or generation to a JSONL or CSV file
+    (chosen by the file suffix) and flushes it right away.
+
+    Besides the given fields, every record contains the score distribution,
+    game steps and evaluations per second, the split of the wall time into
+    evaluation and everything else, and the utilisation of the workers.
+    """
+
+    def __init__(self, path, n_workers=1):
+        self.path = Path(path)
+        self.n_workers = n_workers
+        self.csv = self.path.suffix == ".csv"
+        write_header = not self.path.exists() or not self.path.stat().st_size
+        self.file = open(self.path, "a", newline="")
+        self._writer = None
+        self._write_header = self.csv and write_header
+        self._last = time.perf_counter()
+
+    def mark(self):
+        """Start the next time interval now, e.g. to exclude visualisation"""
+        self._last = time.perf_counter()
+
+    def record(self, stats, **fields):
+        now = time.perf_counter()
+        wall = now - self._last
+        self._last = now
+
+        eval_seconds = stats.eval_seconds
+        if eval_seconds:
+            utilisation = stats.busy_seconds / (eval_seconds * self.n_workers)
+        else:
+            utilisation = 0.0
+        record = {
+            "time": time.time(),
+            **fields,
+            **score_summary(stats.scores),
+            "steps": stats.steps,
+            "evaluations": stats.evaluations,
+            "steps_per_second": stats.steps / wall if wall else 0.0,
+            "evaluations_per_second": stats.evaluations / wall if wall else 0.0,
+            "wall_seconds": wall,
+            "eval_seconds": eval_seconds,
+            "other_seconds": max(0.0, wall - eval_seconds),
+            "utilisation": utilisation,
+        }
+        stats.reset()
+        self.write(record)
+        return record
+
+    def write(self, record):
+        if self.csv:
+            if self._writer is None:
+                self._writer = csv.DictWriter(
+                    self.file, fieldnames=list(record), extrasaction="ignore"
+                )
+                if self._write_header:
+                    self._writer.writeheader()
+            self._writer.writerow(record)
+        else:
+            self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
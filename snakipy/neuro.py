@@ -1,5 +1,20 @@
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
 import numpy as np
 
+# Binary inputs up to this size can be compiled into a lookup table
+MAX_POLICY_INPUTS = 16
+POLICY_CACHE_SIZE = 1024
+# A net compiles its policy table on its own after this many decisions.
+# Compiling costs about as much as 800 forward passes, so short-lived nets
+# (e.g. optimization candidates) keep calling `forward`.
+POLICY_COMPILE_DECISIONS = 1024
+_BIT_WEIGHTS = 1 << np.arange(MAX_POLICY_INPUTS)
+_policy_cache = OrderedDict()
+
 
 def cross_entropy(y, y_net):
     n = y.shape[0]
@@ -24,6 +39,8 @@ class NeuralNet:
         if dna is None:
             self.W1 /= np.sqrt(self.W1.shape[0])
             self.W2 /= np.sqrt(self.W2.shape[0])
+        self._policy = None
+        self.n_decisions = 0
 
     def forward(self, x1):
         x2 = np.tanh(x1 @ self.W1[:-1] + self.W1[-1])
@@ -35,8 +52,148 @@ class NeuralNet:
     def decide(self, x1):
         return np.argmax(self.forward(x1))
 
+    def _cache_key(self):
+        return self.W1.shape, self.W1.tobytes(), self.W2.tobytes()
+
+    def digest(self):
+        """Hash of the weights, to recognize policy tables saved for them"""
+        digest = hashlib.sha256(repr(self.W1.shape).encode())
+        digest.update(self.W1.tobytes())
+        digest.update(self.W2.tobytes())
+        return digest.hexdigest()
+
+    @property
+    def policy_table(self):
+        """
+        Decisions for all binary inputs, indexed by the bit-packed input.
+        Tables are compiled in one batched forward pass, kept on the net and
+        cached per weights, so other nets with the same weights reuse them.
+        """
+        if self._policy is None:
+            self._policy = self.registered_policy()
+        if self._policy is None:
+            self._policy = compile_policy(self)
+            register_policy(self, self._policy)
+        return self._policy
+
+    def registered_policy(self):
+        """The cached policy table for these weights, or None"""
+        key = self._cache_key()
+        table = _policy_cache.get(key)
+        if table is not None:
+            _policy_cache.move_to_end(key)
+        return table
+
+    def policy(self, x1):
+        """
+        Same as `decide` for binary inputs.
+        Decisions are read from the policy table if the net has one, which
+        it compiles itself once it has made `POLICY_COMPILE_DECISIONS`
+        decisions.
+
+        Examples:
+            >>> net = NeuralNet(16, 5, 3)
+            >>> x = np.random.randint(0, 2, size=16).astype(float)
+            >>> bool(net.policy(x) == net.decide(x))
+            True
+            >>> net.policy_table.size
+            65536
+            >>> bool(net.policy(x) == net.decide(x))
+            True
+        """
+        if self._policy is None:
+            if not self.n_decisions:
+                self._policy = self.registered_policy()
+            self.n_decisions += 1
+            if self._policy is None and self.n_decisions < POLICY_COMPILE_DECISIONS:
+                return int(self.decide(x1))
+        return int(self.policy_table[int(x1 @ _BIT_WEIGHTS[: x1.size])])
+
     def __getstate__(self):
         return {"W1": self.W1, "W2": self.W2}
 
     def __setstate__(self, state):
+        self._policy = None
+        self.n_decisions = 0
         self.__dict__.update(state)
+
+
+@lru_cache(maxsize=None)
+def binary_inputs(n):
+    """All 2**n binary vectors of length n, row i being the bits of i"""
+    inputs = ((np.arange(2 ** n)[:, None] >> np.arange(n)) & 1).astype(float)
+    inputs.flags.writeable = False
+    return inputs
+
+
+def compile_policy(net):
+    """Evaluate `net` on every binary input and keep the decisions"""
+    in_size = net.W1.shape[0] - 1
+    if in_size > MAX_POLICY_INPUTS:
+        raise ValueError(f"Cannot compile a policy for {in_size} inputs")
+    return net.forward(binary_inputs(in_size)).argmax(axis=-1).astype(np.uint8)
+
+
+def register_policy(net, table):
+    """Put a compiled (e.g. loaded) policy table into the cache"""
+    _policy_cache[net._cache_key()] = table
+    if len(_policy_cache) > POLICY_CACHE_SIZE:
+        _policy_cache.popitem(last=False)
+
+
+def policy_file(dna_file):
+    """
+    Where the policy table belonging to a DNA file is stored.
+
+    Examples:
+        >>> str(policy_file("best.npy"))
+        'best.policy.npz'
+    """
+    path = Path(dna_file)
+    return path.with_name(path.name[: -len(path.suffix) or None] + ".policy.npz")
+
+
+def save_policy(net, dna_file):
+    """Store the policy table of `net` together with the digest of its weights"""
+    np.savez(policy_file(dna_file), table=net.policy_table, digest=net.digest())
+
+
+def load_policy(net, dna_file):
+    """
+    Give `net` its policy table.
+    The table saved next to `dna_file` is used if it was compiled from the
+    same weights, otherwise the table is compiled.
+
+    Examples:
+        >>> import os, tempfile
+        >>> dna_file = os.path.join(tempfile.mkdtemp(), "best.npy")
+        >>> net = NeuralNet(16, 5, 3)
+        >>> save_policy(net, dna_file)
+        >>> same = NeuralNet(16, 5, 3, dna=net.dna.copy())
+        >>> bool((load_policy(same, dna_file) == net.policy_table).all())
+        True
+        >>> other = NeuralNet(16, 5, 3)
+        >>> bool((load_policy(other, dna_file) == compile_policy(other)).all())
+        True
+    """
+    path = policy_file(dna_file)
+    if net._policy is None and path.exists():
+        with np.load(path) as saved:
+            if str(saved["digest"]) == net.digest():
+                net._policy = saved["table"]
+                register_policy(net, net._policy)
+    return net.policy_table
+
+
+def batch_forward(nets, x1):
+    """
+    Evaluate several nets of the same shape at once.
+    Row i of `x1` is fed into `nets[i]`.
+    """
+    W1 = np.stack([net.W1 for net in nets])
+    W2 = np.stack([net.W2 for net in nets])
+    x2 = np.tanh(np.einsum("bi,bij->bj", x1, W1[:, :-1]) + W1[:, -1])
+    x3 = np.einsum("bi,bij->bj", x2, W2[:, :-1]) + W2[:, -1]
+    softmax_x3 = np.exp(x3 - x3.max(axis=-1, keepdims=True))
+    softmax_x3 /= softmax_x3.sum(axis=-1, keepdims=True)
+    return softmax_x3
@@ -1,13 +1,21 @@
 import logging
+import multiprocessing
 import random
+import time
 
 import fire
 import numpy as np
 from abc_algorithm import Swarm
 from tqdm import tqdm, trange
 
+from snakipy import accel, checkpoint
+from snakipy.archive import DNAArchive
 from snakipy.game import Game
+from snakipy.loops import LoopDetector, play_out
+from snakipy.metrics import EvaluationStats, MetricsSink
+from snakipy.neuro import NeuralNet, save_policy
 from snakipy.snake import NeuroSnake, Direction
+from snakipy.surrogate import Surrogate
 from snakipy.ui import CursesUI, PygameUI
 
 logger = logging.getLogger(__name__)
@@ -15,43 +23,238 @@ logger = logging.getLogger(__name__)
 
 class ParameterSearch:
     def __init__(
-        self, game_options, snake_options, max_steps=10_000, n_average=10, dna=None
+        self,
+        game_options,
+        snake_options,
+        max_steps=10_000,
+        n_average=10,
+        dna=None,
+        n_workers=1,
+        backend="auto",
+        loop_detection=True,
+        loop_penalty=None,
+        surrogate=None,
+        n_screened=1,
     ):
         self.game_options = game_options
         self.snake_options = snake_options
         self.max_steps = max_steps
         self.n_average = n_average
         self.dna = dna
+        self.n_workers = n_workers
+        # "auto" uses the compiled kernel whenever Numba is available
+        self.backend = accel.resolve_backend(backend, game_options, snake_options)
+        # Games are stopped at the first repeated state, see `LoopDetector`
+        self.loop_detection = loop_detection
+        self.loop_penalty = loop_penalty
+        # Candidates the `Surrogate` predicts to be far below the elite only
+        # get `n_screened` rollouts. With 0 their cost is the prediction.
+        self.surrogate = surrogate
+        self.n_screened = n_screened
+        self.stats = EvaluationStats()
+        # Every evaluated DNA is stored here if set
+        self.archive = None
+        self.generation = 0
+        self._pool = None
+
+    def __getstate__(self):
+        # The worker pool, the archive and the surrogate stay in the parent process
+        return {
+            k: v
+            for k, v in vars(self).items()
+            if k not in ("_pool", "archive", "surrogate")
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._pool = None
+        self.archive = None
+        self.surrogate = None
+
+    def _archive(self, dnas, costs, seeds):
+        if self.archive is not None:
+            self.archive.append(
+                dnas,
+                fitness=-np.asarray(costs),
+                seeds=seeds,
+                generation=self.generation,
+            )
 
     def benchmark(self, dna):
+        return self.benchmark_batch([dna])[0]
+
+    def _evaluate(self, dna, seeds):
+        """Returns the benchmark value, the number of game steps and the time"""
+        if not len(seeds):
+            return np.nan, 0, 0.0
+        start = time.perf_counter()
         score = 0
-        for _ in range(self.n_average):
+        steps = 0
+        for seed in seeds:
+            game_options = {**self.game_options, "seed": seed}
+            if self.backend == "numba":
+                game_score, heads = accel.simulate(
+                    game_options,
+                    self.snake_options,
+                    dna,
+                    self.max_steps,
+                    detect_loops=self.loop_detection,
+                    loop_penalty=self.loop_penalty,
+                )
+                score += game_score
+                steps += len(heads)
+                continue
             game = Game(
-                **self.game_options,
-                player_snake=NeuroSnake(**self.snake_options, dna=dna),
+                **game_options,
+                player_snake=NeuroSnake.new_snake(**self.snake_options, dna=dna),
             )
             score += self.run(game)
-        return -score / self.n_average
+            steps += game.n_steps
+        return -score / len(seeds), steps, time.perf_counter() - start
+
+    def _game_seeds(self, rollouts):
+        """
+        Seed of each candidate and the seeds of its games.
+        Without a fixed seed the candidate seeds are drawn from `np.random`,
+        so a run resumed from a checkpoint plays the same games, and game i
+        of a candidate is seeded with its seed + i like in `evaluate_population`.
+        """
+        seed = self.game_options.get("seed")
+        if seed is not None:
+            return np.full(len(rollouts), seed), [[seed] * n for n in rollouts]
+        seeds = np.random.randint(2 ** 31, size=len(rollouts))
+        return seeds, [
+            list(range(seed, seed + n)) for seed, n in zip(seeds.tolist(), rollouts)
+        ]
+
+    def _screen(self, dnas):
+        """Number of rollouts per candidate and the surrogate predictions"""
+        rollouts = np.full(len(dnas), self.n_average)
+        if self.surrogate is None or not self.surrogate.ready:
+            return rollouts, None
+        predicted = self.surrogate.predict(dnas)
+        flagged = predicted < self.surrogate.threshold
+        rollouts[flagged] = min(self.n_screened, self.n_average)
+        self.surrogate.saved_rollouts += int((self.n_average - rollouts).sum())
+        return rollouts, predicted
+
+    def benchmark_batch(self, dnas):
+        """
+        Benchmark every row of `dnas`.
+        With n_workers > 1 the rows are spread over worker processes.
+        """
+        dnas = np.atleast_2d(dnas)
+        rollouts, predicted = self._screen(dnas)
+        start = time.perf_counter()
+        seeds, game_seeds = self._game_seeds(rollouts)
+        tasks = list(zip(dnas, game_seeds))
+        if self.n_workers > 1 and len(tasks) > 1:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.n_workers)
+            results = self._pool.starmap(self._evaluate, tasks)
+        else:
+            results = [self._evaluate(dna, seeds) for dna, seeds in tasks]
+        self.stats.eval_seconds += time.perf_counter() - start
+
+        costs = np.array([cost for cost, _, _ in results])
+        played = rollouts > 0
+        if predicted is not None:
+            costs[~played] = -predicted[~played]
+            # Flagged candidates count too, with their screening rollouts,
+            # otherwise the accuracy only covers the candidates it let through
+            self.surrogate.record(predicted[played], -costs[played])
+        # Predictions of skipped candidates are no scores, and an evaluation
+        # is one game of one candidate, as in `evaluate_population`
+        for n, (cost, steps, seconds) in zip(rollouts, results):
+            if n:
+                self.stats.add(-cost, steps, seconds, evaluations=n)
+        if self.surrogate is not None:
+            self.surrogate.add(dnas[played], -costs[played])
+        self._archive(dnas[played], costs[played], seeds[played])
+        return costs
 
     def run(self, game):
-        game_it = iter(game)
-        direction = None
-        player_snake = game.player_snake
-
-        for step in range(self.max_steps):
-            try:
-                game_it.send(direction)
-            except StopIteration:
-                break
-            direction = player_snake.decide_direction(
-                game.reduced_coordinates(player_snake).flatten()
-            )
-        logger.debug("Stopped after %s steps", step)
+        n_steps = self.max_steps
+        if game.number_of_steps is not None:
+            n_steps = min(n_steps, game.number_of_steps)
+
+        detector = LoopDetector(self.loop_penalty) if self.loop_detection else None
+        play_out(game, n_steps, detector)
+        logger.debug("Stopped after %s steps", game.n_steps)
         (game_score,) = game.rewards
         logger.info("Total score: %s", game_score)
         return game_score
 
 
+class EvolutionStrategy:
+    """
+    Evolution strategy with antithetic sampling and rank based fitness shaping.
+
+    Every cycle draws `population_size` perturbations of the current mean
+    as one matrix, evaluates them with a single call of `func` and moves
+    the mean along the fitness weighted perturbations.
+    Like `Swarm`, it minimizes `func`, which has to map a (n, dim) matrix
+    to n objective values.
+
+    Examples:
+        >>> es = EvolutionStrategy(
+        ...     lambda x: (x ** 2).sum(axis=1), 3, x0=np.ones(3), max_cycles=300, seed=0
+        ... )
+        >>> best = list(es.run())[-1]
+        >>> bool(np.abs(es.mean).max() < 0.1)
+        True
+    """
+
+    def __init__(
+        self,
+        func,
+        dim,
+        *,
+        population_size=50,
+        sigma=0.1,
+        learning_rate=0.05,
+        max_cycles=100,
+        x0=None,
+        seed=None,
+    ):
+        self.func = func
+        self.dim = dim
+        self.half = max(1, population_size // 2)
+        self.sigma = sigma
+        self.learning_rate = learning_rate
+        self.max_cycles = max_cycles
+        self.rng = np.random.RandomState(seed)
+        self.mean = np.zeros(dim) if x0 is None else np.array(x0, dtype=float)
+
+        self.best_position = None
+        self.best_value = None
+
+    def run(self):
+        for _ in range(self.max_cycles):
+            yield self.step()
+
+    def step(self):
+        noise = self.rng.randn(self.half, self.dim)
+        noise = np.concatenate([noise, -noise])
+        candidates = self.mean + self.sigma * noise
+        values = np.asarray(self.func(candidates), dtype=float)
+
+        # Centered ranks in [-0.5, 0.5], the lowest value gets the highest weight
+        ranks = np.empty(values.size)
+        ranks[np.argsort(-values)] = np.arange(values.size)
+        weights = ranks / (values.size - 1) - 0.5
+
+        self.mean += self.learning_rate / (values.size * self.sigma) * weights @ noise
+
+        best = np.argmin(values)
+        logger.info("Best value in this step: %s", values[best])
+        if self.best_value is None or values[best] < self.best_value:
+            self.best_value = values[best]
+            self.best_position = candidates[best].copy()
+        logger.info("Overall best value: %s", self.best_value)
+        return candidates[best]
+
+
 def training(
     n_optimize=100,
     hidden_size=5,
@@ -67,6 +270,23 @@ def training(
     width=20,
     height=None,
     seed=None,
+    optimizer="abc",
+    population_size=50,
+    sigma=0.1,
+    learning_rate=0.05,
+    n_workers=1,
+    metrics_file=None,
+    archive_file=None,
+    warm_start=0,
+    backend="auto",
+    loop_detection=True,
+    loop_penalty=None,
+    checkpoint_file=None,
+    checkpoint_interval=1,
+    resume=False,
+    surrogate=False,
+    surrogate_margin=2.0,
+    n_screened=1,
 ):
     logging.basicConfig(
         level=getattr(logging, log_level.upper()),
@@ -88,8 +308,8 @@ def training(
     snake_options = {
         "x": x // 2,
         "y": y // 2,
-        "max_x": x,
-        "max_y": y,
+        "board_width": x,
+        "board_height": y,
         "input_size": input_size,
         "hidden_size": hidden_size,
         "direction": Direction.SOUTH,
@@ -109,31 +329,117 @@ def training(
         )
 
     opt = ParameterSearch(
-        game_options, snake_options, max_steps=max_steps, n_average=n_average, dna=dna
+        game_options,
+        snake_options,
+        max_steps=max_steps,
+        n_average=n_average,
+        dna=dna,
+        n_workers=n_workers,
+        backend=backend,
+        loop_detection=loop_detection,
+        loop_penalty=loop_penalty,
+        surrogate=Surrogate(margin=surrogate_margin) if surrogate else None,
+        n_screened=n_screened,
     )
-    swarm = Swarm(
-        opt.benchmark,
-        (input_size + 1) * hidden_size + (hidden_size + 1) * out_size,
-        n_employed=n_employed,
-        n_onlooker=n_onlooker,
-        limit=10,
-        max_cycles=n_optimize,
-        lower_bound=-1,
-        upper_bound=1,
-        search_radius=search_radius,
-    )
-    for result in swarm.run():
+    dim = (input_size + 1) * hidden_size + (hidden_size + 1) * out_size
+
+    archive = DNAArchive(archive_file, dna_size=dim) if archive_file else None
+    opt.archive = archive
+    if archive is not None:
+        opt.generation = archive.n_generations
+    warm_dnas = archive.best(warm_start)["dna"] if warm_start and archive else []
+    if len(warm_dnas):
+        logger.info("Warm start from the best %s archived DNAs", len(warm_dnas))
+        dna = warm_dnas.mean(axis=0)
+
+    start_cycle = 0
+    if resume and checkpoint.exists(checkpoint_file):
+        state = checkpoint.load(checkpoint_file)
+        if state["optimizer"] != optimizer:
+            raise ValueError(
+                f"Checkpoint was written by optimizer {state['optimizer']}"
+            )
+        search = state["search"]
+        start_cycle = state["cycle"]
+        opt.generation = state["generation"]
+        opt.surrogate = state["surrogate"]
+        # The pickled objective is a copy without worker pool and archive
+        if optimizer == "abc":
+            for bee in search.bees:
+                bee.func = opt.benchmark
+        else:
+            search.func = opt.benchmark_batch
+        if archive is not None:
+            archive.truncate(state["archive_count"])
+        checkpoint.restore_random_states(state)
+        logger.info("Resuming from cycle %s of %s", start_cycle, checkpoint_file)
+    elif optimizer == "abc":
+        search = Swarm(
+            opt.benchmark,
+            dim,
+            n_employed=n_employed,
+            n_onlooker=n_onlooker,
+            limit=10,
+            max_cycles=n_optimize,
+            lower_bound=-1,
+            upper_bound=1,
+            search_radius=search_radius,
+        )
+        for bee, warm_dna in zip(search.bees, warm_dnas):
+            bee.pos[:] = warm_dna
+            bee._fitness = bee.calculate_fitness(bee.pos)
+    elif optimizer == "es":
+        search = EvolutionStrategy(
+            opt.benchmark_batch,
+            dim,
+            population_size=population_size,
+            sigma=sigma,
+            learning_rate=learning_rate,
+            max_cycles=n_optimize,
+            x0=dna,
+            seed=seed,
+        )
+    else:
+        raise ValueError(f"Unknown optimizer {optimizer}")
+    search.max_cycles = n_optimize - start_cycle
+
+    sink = MetricsSink(metrics_file, n_workers=n_workers) if metrics_file else None
+    for cycle, result in enumerate(search.run(), start=start_cycle):
+        opt.generation += 1
+        if opt.surrogate is not None:
+            logger.info("Surrogate: %s", opt.surrogate.accuracy())
+        if sink:
+            fields = opt.surrogate.accuracy() if opt.surrogate is not None else {}
+            sink.record(opt.stats, cycle=cycle, optimizer=optimizer, **fields)
+        if checkpoint_file and (cycle + 1) % checkpoint_interval == 0:
+            checkpoint.save(
+                checkpoint_file,
+                {
+                    "optimizer": optimizer,
+                    "search": search,
+                    "cycle": cycle + 1,
+                    "generation": opt.generation,
+                    "surrogate": opt.surrogate,
+                    "archive_count": len(archive) if archive is not None else 0,
+                    **checkpoint.random_states(),
+                },
+            )
         logger.info("Saving to %s", dna_file)
         np.save(dna_file, result)
+        net = NeuralNet(input_size, hidden_size, out_size, dna=result)
+        save_policy(net, dna_file)
         game = Game(
             **game_options,
-            player_snake=NeuroSnake(**snake_options, dna=np.load(dna_file)),
+            number_of_steps=max_steps,
+            player_snake=NeuroSnake.new_snake(**snake_options, dna=np.load(dna_file)),
         )
-        ui = CursesUI(game, robot=True, n_steps=max_steps)
+        ui = CursesUI(game, robot=True)
         try:
             ui.run()
         except StopIteration:
             pass
+        if sink:
+            sink.mark()
 
 
 def create_snakes(size, n_x, n_y, dnas=None):
@@ -164,16 +470,38 @@ def create_snakes(size, n_x, n_y, dnas=None):
     return snakes
 
 
-def evolve(dnas, scores, n=5):
+def population(snakes):
+    """Start positions, directions and DNAs of freshly created snakes"""
+    return [(*snake.head, snake.direction, snake.dna) for snake in snakes]
+
+
+def restore_population(population, size):
+    """The snakes described by `population`"""
+    return [
+        NeuroSnake.new_snake(
+            x, y, *size, input_size=16, hidden_size=5, direction=direction, dna=dna
+        )
+        for x, y, direction, dna in population
+    ]
+
+
+def evolve(dnas, scores, n=5, surrogate=None, max_tries=10):
+    """
+    Keep the `n` best DNAs, add mutations of them and random newcomers.
+    Mutations flagged by the `surrogate` are drawn again, up to `max_tries` times.
+    """
     top_indices = np.argsort(scores)[::-1][:n]
     top_dna = [dnas[i] for i in top_indices]
     n_mutate = (len(dnas) - n) // 3 * 2
     n_random = len(dnas) - n - n_mutate
     new_dnas = []
     for _ in range(n_mutate):
-        dna = random.choice(top_dna) + np.random.normal(
-            0, scale=0.01, size=top_dna[0].size
-        )
+        for _ in range(max_tries):
+            dna = random.choice(top_dna) + np.random.normal(
+                0, scale=0.01, size=top_dna[0].size
+            )
+            if surrogate is None or not surrogate.screen(dna)[0]:
+                break
         new_dnas.append(dna)
 
     new_dnas.extend([None] * n_random)
@@ -181,7 +509,77 @@ def evolve(dnas, scores, n=5):
     return top_dna + new_dnas
 
 
-def snake_evolution(dnafile=None, n_steps=500, n_batch=10, n_games=100, debug=False):
+def evaluate_population(
+    snakes,
+    size,
+    n_batch=10,
+    n_steps=500,
+    debug=False,
+    progress=True,
+    stats=None,
+    seed=None,
+    loop_detection=True,
+    loop_penalty=None,
+):
+    """
+    Average score of each snake over `n_batch` games played together.
+    Game i is seeded with `seed + i` if a seed is given.
+    Game steps, evaluations and timings are added to `stats` if given.
+    Games whose state repeats are stopped early, see `LoopDetector`.
+    """
+    start = time.perf_counter()
+    scores = []
+    steps = 0
+    detector = LoopDetector(loop_penalty) if loop_detection else None
+    for i in trange(n_batch, disable=not progress):
+        game = Game(
+            *size,
+            snakes=snakes,
+            border=True,
+            number_of_steps=n_steps,
+            seed=None if seed is None else seed + i,
+        )
+
+        if debug:
+            ui = PygameUI(game, size=size, fps=100, robot=True)
+            ui.run()
+
+        else:
+            play_out(game, n_steps, detector)
+
+        scores.append(game.rewards)
+        steps += game.n_steps
+
+    scores = np.mean(scores, axis=0)
+    if detector is not None and detector.skipped_steps:
+        logger.debug("Loop detection skipped %s steps", detector.skipped_steps)
+    if stats is not None:
+        seconds = time.perf_counter() - start
+        stats.scores.extend(scores)
+        stats.steps += steps
+        stats.evaluations += n_batch * len(snakes)
+        stats.eval_seconds += seconds
+        stats.busy_seconds += seconds
+    return scores
+
+
+def snake_evolution(
+    dnafile=None,
+    n_steps=500,
+    n_batch=10,
+    n_games=100,
+    debug=False,
+    metrics_file=None,
+    archive_file=None,
+    warm_start=0,
+    loop_detection=True,
+    loop_penalty=None,
+    checkpoint_file=None,
+    checkpoint_interval=1,
+    resume=False,
+    surrogate=False,
+    surrogate_margin=2.0,
+):
     logging.basicConfig(level=logging.DEBUG if debug else logging.INFO)
     size = (80, 60)
     nx, ny = 8, 6
@@ -191,31 +589,71 @@ def snake_evolution(dnafile=None, n_steps=500, n_batch=10, n_games=100, debug=Fa
     else:
         dna = None
 
-    snakes = create_snakes(size, nx, ny, dnas=[dna] * nx * ny)
-
-    for _ in trange(n_games):
-
-        scores = []
-        for _ in trange(n_batch):
-            game = Game(*size, snakes=snakes, border=True, number_of_steps=n_steps)
-
-            if debug:
-                ui = PygameUI(game, size=size, fps=100, robot=True)
-                ui.run()
-
-            else:
-                for _ in game:
-                    pass
-
-            scores.append(game.rewards)
-
+    dnas = [dna] * nx * ny
+    archive = None
+    if archive_file:
+        archive = DNAArchive(archive_file, dna_size=(16 + 1) * 5 + (5 + 1) * 3)
+    model = Surrogate(margin=surrogate_margin) if surrogate else None
+
+    start = 0
+    if resume and checkpoint.exists(checkpoint_file):
+        state = checkpoint.load(checkpoint_file)
+        snakes = restore_population(state["population"], size)
+        start = state["generation"]
+        model = state["surrogate"]
+        if archive is not None:
+            archive.truncate(state["archive_count"])
+        checkpoint.restore_random_states(state)
+        logger.info("Resuming from generation %s of %s", start, checkpoint_file)
+    else:
+        if warm_start and archive:
+            logger.info("Sampling the population from the %s best archived", warm_start)
+            dnas = list(archive.sample(nx * ny, top=warm_start)["dna"])
+        snakes = create_snakes(size, nx, ny, dnas=dnas)
+    sink = MetricsSink(metrics_file) if metrics_file else None
+    stats = EvaluationStats()
+
+    for generation in trange(start, n_games):
+        seed = np.random.randint(2 ** 31)
         dnas = [snk.dna for snk in snakes]
-        scores = np.mean(scores, axis=0)
+        predicted = model.predict(dnas) if model is not None and model.ready else None
+        scores = evaluate_population(
+            snakes,
+            size,
+            n_batch,
+            n_steps,
+            debug=debug,
+            stats=stats,
+            seed=seed,
+            loop_detection=loop_detection,
+            loop_penalty=loop_penalty,
+        )
+
+        if model is not None:
+            if predicted is not None:
+                model.record(predicted, scores)
+                logger.info("Surrogate: %s", model.accuracy())
+            model.add(np.array(dnas), scores)
+        if archive is not None:
+            archive.append(np.array(dnas), fitness=scores, seeds=seed)
         logger.info("Median score: %s", np.median(scores))
         logger.info("Mean score: %s", np.mean(scores))
         logger.info("Top score: %s", np.max(scores))
-        new_dnas = evolve(dnas, scores)
+        new_dnas = evolve(dnas, scores, surrogate=model)
         snakes = create_snakes(size, nx, ny, dnas=new_dnas)
+        if sink:
+            sink.record(stats, generation=generation)
+        if checkpoint_file and (generation + 1) % checkpoint_interval == 0:
+            checkpoint.save(
+                checkpoint_file,
+                {
+                    "population": population(snakes),
+                    "generation": generation + 1,
+                    "surrogate": model,
+                    "archive_count": len(archive) if archive is not None else 0,
+                    **checkpoint.random_states(),
+                },
+            )
 
     game = Game(*size, snakes=snakes, border=True)
     ui = PygameUI(game, size=size, fps=20)
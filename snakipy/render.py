@@ -0,0 +1,235 @@
+"""Offscreen rendering of games into RGB arrays"""
+import logging
+import struct
+from itertools import islice
+
+import numpy as np
+
+from snakipy.game import Game
+from snakipy.neuro import NeuralNet, load_policy
+from snakipy.snake import Direction, NeuroSnake
+
+logger = logging.getLogger(__name__)
+
+
+BACKGROUND = 0
+FRUIT = 1
+HEAD = 2
+# Labels from here on are snake bodies, one color per reward slot
+BODY = 3
+
+PALETTE = np.array(
+    [
+        (0, 0, 0),
+        (255, 0, 0),
+        (255, 255, 255),
+        (0, 255, 0),
+        (0, 255, 255),
+        (0, 0, 255),
+        (255, 255, 0),
+        (255, 0, 255),
+    ],
+    dtype=np.uint8,
+)
+N_BODY_COLORS = len(PALETTE) - BODY
+
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+# Fixed header size, so the header can be rewritten once the length is known
+NPY_HEADER_SIZE = 128
+
+
+def iter_states(game, n_steps):
+    """
+    Play `game` for at most `n_steps` steps.
+    Yields the states before the first and after every step.
+    """
+    yield game.snapshot()
+    for _ in range(n_steps):
+        if not game.snakes:
+            break
+        game.step()
+        yield game.snapshot()
+
+
+def record(game, n_steps):
+    """All states of `iter_states` as a list"""
+    return list(iter_states(game, n_steps))
+
+
+def _cells(coordinates):
+    return np.array(coordinates, dtype=int).reshape(-1, 2)
+
+
+def label_frames(states, width, height):
+    """
+    Paint the states into a (T, height, width) array of labels.
+    The cells of all frames are collected first and painted with one
+    fancy-indexed assignment per layer.
+    """
+    labels = np.full((len(states), height, width), BACKGROUND, dtype=np.uint8)
+
+    frame_idx, cells, colors = [], [], []
+    heads = []
+    fruit_idx, fruits = [], []
+    for t, state in enumerate(states):
+        for slot, snake in zip(state.slots, state.snakes):
+            body = _cells(snake.coordinates)
+            frame_idx.append(np.full(len(body), t))
+            cells.append(body)
+            colors.append(np.full(len(body), BODY + slot % N_BODY_COLORS))
+            heads.append((t, *snake.head))
+        if state.fruits:
+            fruit_idx.append(np.full(len(state.fruits), t))
+            fruits.append(_cells(state.fruits))
+
+    def paint(t, xy, value):
+        x, y = xy[:, 0], xy[:, 1]
+        inside = (0 <= x) & (x < width) & (0 <= y) & (y < height)
+        labels[t[inside], y[inside], x[inside]] = (
+            value[inside] if np.ndim(value) else value
+        )
+
+    if fruits:
+        paint(np.concatenate(fruit_idx), np.concatenate(fruits), FRUIT)
+    if cells:
+        paint(np.concatenate(frame_idx), np.concatenate(cells), np.concatenate(colors))
+        heads = np.array(heads)
+        paint(heads[:, 0], heads[:, 1:], HEAD)
+    return labels
+
+
+def render(states, width, height, scale=4):
+    """
+    RGB frames of the given states as a (T, height * scale, width * scale, 3)
+    uint8 array. Every board cell becomes a square of scale x scale pixels.
+
+    Examples:
+        >>> snake = NeuroSnake.new_snake(5, 5, 10, 8, Direction.SOUTH)
+        >>> game = Game(10, 8, player_snake=snake, seed=0)
+        >>> frames = render(record(game, 3), 10, 8, scale=2)
+        >>> frames.shape, frames.dtype
+        ((4, 16, 20, 3), dtype('uint8'))
+        >>> frames[0, 10, 10].tolist()
+        [255, 255, 255]
+    """
+    rgb = PALETTE[label_frames(states, width, height)]
+    n_frames = len(states)
+    rgb = np.broadcast_to(
+        rgb[:, :, None, :, None, :], (n_frames, height, scale, width, scale, 3)
+    )
+    return rgb.reshape(n_frames, height * scale, width * scale, 3)
+
+
+def render_chunks(game, n_steps, scale=4, chunk_size=256):
+    """Play `game` and yield its frames in chunks of `chunk_size`"""
+    states = iter_states(game, n_steps)
+    while True:
+        chunk = list(islice(states, chunk_size))
+        if not chunk:
+            return
+        yield render(chunk, game.width, game.height, scale)
+
+
+class FrameWriter:
+    """
+    Streams frames into a .npy file which grows chunk by chunk.
+    The header is rewritten with the final number of frames on `close`,
+    so the file can be read with `np.load(path, mmap_mode="r")`.
+
+    Examples:
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), "frames.npy")
+        >>> with FrameWriter(path, 2, 3) as writer:
+        ...     writer.write(np.zeros((4, 2, 3, 3), dtype=np.uint8))
+        ...     writer.write(np.ones((1, 2, 3, 3), dtype=np.uint8))
+        >>> np.load(path).shape
+        (5, 2, 3, 3)
+    """
+
+    def __init__(self, path, height, width):
+        self.path = path
+        self.frame_shape = (height, width, 3)
+        self.n_frames = 0
+        self.file = open(path, "wb")
+        self._write_header()
+
+    def _write_header(self):
+        header = repr(
+            {
+                "descr": "|u1",
+                "fortran_order": False,
+                "shape": (self.n_frames, *self.frame_shape),
+            }
+        )
+        header_size = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2
+        header = header.ljust(header_size - 1).encode() + b"\n"
+        self.file.seek(0)
+        self.file.write(NPY_MAGIC + struct.pack("<H", header_size) + header)
+        self.file.seek(0, 2)
+
+    def write(self, frames):
+        frames = np.ascontiguousarray(frames, dtype=np.uint8)
+        if frames.shape[1:] != self.frame_shape:
+            raise ValueError(
+                f"Frames of shape {frames.shape[1:]} do not fit {self.frame_shape}"
+            )
+        self.file.write(frames.tobytes())
+        self.n_frames += len(frames)
+
+    def close(self):
+        self._write_header()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def render_game(
+    output="frames.npy",
+    dna_file=None,
+    width=20,
+    height=None,
+    n_fruits=30,
+    hidden_size=10,
+    border=False,
+    n_steps=1000,
+    scale=8,
+    chunk_size=256,
+    seed=None,
+):
+    """Play a game of a NeuroSnake and write its frames to `output`"""
+    if not height:
+        height = width
+    input_size = 16
+    dna = net = None
+    if dna_file:
+        dna = np.load(dna_file)
+        net = NeuralNet(input_size, hidden_size, 3, dna=dna)
+        load_policy(net, dna_file)
+
+    game = Game(
+        width,
+        height,
+        player_snake=NeuroSnake.new_snake(
+            width // 2,
+            height // 2,
+            board_width=width,
+            board_height=height,
+            input_size=input_size,
+            hidden_size=hidden_size,
+            dna=dna,
+            net=net,
+            direction=Direction.SOUTH,
+        ),
+        max_number_of_fruits=n_fruits,
+        border=border,
+        seed=seed,
+    )
+    with FrameWriter(output, height * scale, width * scale) as writer:
+        for frames in render_chunks(game, n_steps, scale, chunk_size):
+            writer.write(frames)
+    logger.info("Wrote %s frames to %s", writer.n_frames, output)
+    return writer.n_frames
@@ -0,0 +1,78 @@
+"""Search based players built on game snapshots"""
+import logging
+from dataclasses import dataclass
+
+from snakipy.snake import relative_direction
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LookaheadPlayer:
+    """
+    Plays the snake with reward slot `slot` by trying every sequence of
+    `depth` relative moves and picking the first move of the best one.
+    The other snakes keep playing as usual during the simulation.
+
+    Examples:
+        >>> from snakipy.game import Game
+        >>> from snakipy.snake import Direction, Snake
+        >>> snake = Snake.new_snake(5, 8, 10, 10, Direction.SOUTH)
+        >>> game = Game(10, 10, player_snake=snake, seed=0)
+        >>> player = LookaheadPlayer(depth=2)
+        >>> player.decide_direction(game) != Direction.SOUTH
+        True
+    """
+
+    depth: int = 3
+    slot: int = 0
+    simulated_steps: int = 0
+
+    def decide_direction(self, game):
+        sim = game.clone()
+        root = sim.snapshot()
+        direction = sim.snake_in_slot(self.slot).direction
+
+        best_action, best_value = 1, None
+        for action in range(3):
+            sim.restore(root)
+            value = self._simulate(sim, action, self.depth)
+            if best_value is None or value > best_value:
+                best_action, best_value = action, value
+        return relative_direction(direction, best_action)
+
+    def _simulate(self, game, action, depth):
+        """Reward of `action` plus the reward of the best continuation"""
+        idx = game.position_of(self.slot)
+        directions = [None] * len(game.snakes)
+        directions[idx] = relative_direction(game.snakes[idx].direction, action)
+
+        before = game.rewards[self.slot]
+        game.step(directions)
+        self.simulated_steps += 1
+        gain = game.rewards[self.slot] - before
+
+        if depth == 1 or game.position_of(self.slot) is None:
+            return gain
+
+        state = game.snapshot()
+        best = None
+        for next_action in range(3):
+            game.restore(state)
+            value = self._simulate(game, next_action, depth - 1)
+            if best is None or value > best:
+                best = value
+        return gain + best
+
+    def play(self, game, max_steps=1000):
+        """Play `game` until the snake dies. Returns its score."""
+        for _ in range(max_steps):
+            idx = game.position_of(self.slot)
+            if idx is None:
+                break
+            directions = [None] * len(game.snakes)
+            directions[idx] = self.decide_direction(game)
+            game.step(directions)
+        score = game.rewards[self.slot]
+        logger.info("Total score: %s", score)
+        return score
@@ -0,0 +1,363 @@
+"""Asyncio server hosting many concurrent games"""
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from itertools import count
+from typing import Dict, Optional
+
+import numpy as np
+
+from snakipy.game import Game
+from snakipy.neuro import batch_forward
+from snakipy.snake import Direction, NeuroSnake, Snake, relative_direction
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = (0, 1, 2)
+
+
+@dataclass
+class Session:
+    game: Game
+    agent: str
+    steps: int = 0
+    score: float = 0
+    action: Optional[int] = None
+    # Resolved by the tick loop once the pending action has been applied
+    result: Optional[asyncio.Future] = None
+    # Resolved when the game is over
+    finished: Optional[asyncio.Future] = None
+
+    @property
+    def snake(self):
+        return self.game.snakes[0]
+
+    def observation(self):
+        return self.game.reduced_coordinates(self.snake).ravel()
+
+
+@dataclass
+class Metrics:
+    ticks: int = 0
+    steps: int = 0
+    batched_decisions: int = 0
+    busy_time: float = 0.0
+    max_tick_latency: float = 0.0
+    overruns: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    def record_tick(self, n_steps, n_decisions, latency, budget):
+        self.ticks += 1
+        self.steps += n_steps
+        self.batched_decisions += n_decisions
+        self.busy_time += latency
+        self.max_tick_latency = max(self.max_tick_latency, latency)
+        if latency > budget:
+            self.overruns += 1
+
+    def as_dict(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "ticks": self.ticks,
+            "steps": self.steps,
+            "batched_decisions": self.batched_decisions,
+            "steps_per_second": self.steps / elapsed if elapsed else 0.0,
+            "mean_tick_latency": self.busy_time / self.ticks if self.ticks else 0.0,
+            "max_tick_latency": self.max_tick_latency,
+            "overruns": self.overruns,
+            "utilisation": self.busy_time / elapsed if elapsed else 0.0,
+        }
+
+
+class GameServer:
+    """
+    Hosts many single-snake games and advances them in ticks.
+
+    Each tick steps every game that is ready: remote sessions which have
+    sent an action and all built-in `NeuroSnake` sessions. The decisions
+    of all built-in players are computed in one batched forward pass.
+    `tick_interval` is the latency budget of a tick; ticks that take longer
+    are counted as overruns.
+
+    Clients talk newline-delimited JSON over a TCP or Unix socket:
+
+        {"cmd": "new", "agent": "remote"}        -> {"session", "observation"}
+        {"cmd": "new", "agent": "neuro", "dna": [...]}
+        {"cmd": "step", "session": 0, "action": 1}
+            -> {"observation", "reward", "score", "done"}
+        {"cmd": "wait", "session": 0}            -> {"score", "steps"}
+        {"cmd": "stats"}                         -> metrics
+
+    Actions are relative turns, see `snakipy.snake.relative_direction`.
+    Results of finished built-in games are kept for a later "wait" until
+    `max_results` newer ones have arrived.
+    Malformed requests are answered with {"error": ...}.
+    """
+
+    def __init__(
+        self,
+        width=20,
+        height=None,
+        max_steps=1000,
+        tick_interval=0.01,
+        hidden_size=5,
+        seed=None,
+        max_results=1024,
+        **game_options,
+    ):
+        self.width = width
+        self.height = height if height else width
+        self.max_steps = max_steps
+        self.tick_interval = tick_interval
+        self.hidden_size = hidden_size
+        self.game_options = game_options
+        self.rng = np.random.RandomState(seed)
+        self.sessions: Dict[int, Session] = {}
+        self.results: Dict[int, dict] = {}
+        self.max_results = max_results
+        self.metrics = Metrics()
+        self._ids = count()
+        self._tick_task = None
+
+    def create_session(self, agent="remote", dna=None):
+        x, y = self.width // 2, self.height // 2
+        if agent == "neuro":
+            if dna is not None:
+                dna = np.asarray(dna, dtype=float)
+            snake = NeuroSnake.new_snake(
+                x,
+                y,
+                self.width,
+                self.height,
+                Direction.SOUTH,
+                hidden_size=self.hidden_size,
+                dna=dna,
+            )
+        elif agent == "remote":
+            snake = Snake.new_snake(x, y, self.width, self.height, Direction.SOUTH)
+        else:
+            raise ValueError(f"Unknown agent {agent}")
+
+        game = Game(
+            self.width,
+            self.height,
+            player_snake=snake,
+            seed=self.rng.randint(2 ** 31),
+            **self.game_options,
+        )
+        session_id = next(self._ids)
+        self.sessions[session_id] = Session(game, agent)
+        return session_id
+
+    def finish(self, session_id):
+        session = self.sessions.pop(session_id)
+        result = {"score": session.score, "steps": session.steps}
+        if session.finished is not None and not session.finished.done():
+            session.finished.set_result(result)
+        elif session.agent == "neuro":
+            # Nobody is waiting yet, keep the result for a later "wait"
+            self.results[session_id] = result
+            if len(self.results) > self.max_results:
+                del self.results[next(iter(self.results))]
+
+    def _decide(self, sessions):
+        """Batched decisions for the built-in players"""
+        if not sessions:
+            return
+        observations = np.array([session.observation() for session in sessions])
+        actions = batch_forward(
+            [session.snake.net for session in sessions], observations
+        ).argmax(axis=-1)
+        for session, action in zip(sessions, actions):
+            session.action = int(action)
+
+    def tick(self):
+        """Step all ready games once. Returns the number of stepped games."""
+        start = time.perf_counter()
+        ready = [s for s in self.sessions.values() if s.action is not None]
+        neuro = [s for s in self.sessions.values() if s.agent == "neuro"]
+        self._decide(neuro)
+        ready.extend(neuro)
+
+        for session_id, session in list(self.sessions.items()):
+            if session.action is None:
+                continue
+            game = session.game
+            snake = session.snake
+            game.step([relative_direction(snake.direction, session.action)])
+            session.action = None
+            session.steps += 1
+
+            (score,) = game.rewards
+            reward = score - session.score
+            session.score = score
+            done = not game.snakes or session.steps >= self.max_steps
+
+            if session.result is not None and not session.result.done():
+                observation = [] if done else session.observation().tolist()
+                session.result.set_result(
+                    {
+                        "observation": observation,
+                        "reward": reward,
+                        "score": score,
+                        "done": done,
+                    }
+                )
+            if done:
+                self.finish(session_id)
+
+        latency = time.perf_counter() - start
+        self.metrics.record_tick(len(ready), len(neuro), latency, self.tick_interval)
+        if latency > self.tick_interval:
+            logger.debug(
+                "Tick took %.4f s, budget is %.4f s", latency, self.tick_interval
+            )
+        return len(ready)
+
+    async def _run_ticks(self):
+        while True:
+            start = time.perf_counter()
+            self.tick()
+            elapsed = time.perf_counter() - start
+            await asyncio.sleep(max(0.0, self.tick_interval - elapsed))
+
+    def _handle(self, message, owned):
+        """
+        Handle a request. Returns a response or a future of one.
+        Remote sessions created by the request are added to `owned`.
+        """
+        loop = asyncio.get_running_loop()
+        if not isinstance(message, dict):
+            raise ValueError("request must be a JSON object")
+        cmd = message.get("cmd")
+
+        if cmd == "new":
+            agent = message.get("agent", "remote")
+            session_id = self.create_session(agent, dna=message.get("dna"))
+            session = self.sessions[session_id]
+            if agent == "remote":
+                owned.add(session_id)
+            return {
+                "session": session_id,
+                "observation": session.observation().tolist(),
+            }
+
+        if cmd == "stats":
+            return {**self.metrics.as_dict(), "sessions": len(self.sessions)}
+
+        session_id = message.get("session")
+        if cmd == "wait" and session_id in self.results:
+            return self.results.pop(session_id)
+
+        session = self.sessions.get(session_id)
+        if session is None:
+            return {"error": "unknown session"}
+
+        if cmd == "step":
+            if session.agent != "remote":
+                return {"error": "session is not remote controlled"}
+            action = message.get("action")
+            # Checked here, a bad action would break the tick loop later
+            if isinstance(action, bool) or action not in ACTIONS:
+                raise ValueError(f"action must be one of {ACTIONS}")
+            session.action = int(action)
+            session.result = loop.create_future()
+            return session.result
+
+        if cmd == "wait":
+            session.finished = loop.create_future()
+            return session.finished
+
+        return {"error": f"unknown command {cmd}"}
+
+    async def handle_client(self, reader, writer):
+        owned = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = self._handle(json.loads(line), owned)
+                    if isinstance(response, asyncio.Future):
+                        response = await response
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    response = {"error": str(e)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        finally:
+            # Games of disconnected clients would never be stepped again
+            for session_id in owned & self.sessions.keys():
+                self.finish(session_id)
+            writer.close()
+
+    async def start(self, path=None, host="127.0.0.1", port=0):
+        """Listen on a Unix socket if `path` is given, else on TCP"""
+        if path:
+            server = await asyncio.start_unix_server(self.handle_client, path=path)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+        self._tick_task = asyncio.ensure_future(self._run_ticks())
+        return server
+
+    async def stop(self, server):
+        server.close()
+        await server.wait_closed()
+        if self._tick_task:
+            self._tick_task.cancel()
+
+
+class Client:
+    """Minimal client speaking the `GameServer` protocol"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, path=None, host="127.0.0.1", port=None):
+        if path:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def request(self, **message):
+        self.writer.write(json.dumps(message).encode() + b"\n")
+        await self.writer.drain()
+        return json.loads(await self.reader.readline())
+
+    async def new_session(self, agent="remote", dna=None):
+        message = {"agent": agent}
+        if dna is not None:
+            message["dna"] = list(dna)
+        return await self.request(cmd="new", **message)
+
+    async def step(self, session, action):
+        return await self.request(cmd="step", session=session, action=action)
+
+    async def wait(self, session):
+        return await self.request(cmd="wait", session=session)
+
+    async def stats(self):
+        return await self.request(cmd="stats")
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+def serve(path=None, host="127.0.0.1", port=8765, tick_interval=0.01, **options):
+    """Run a game server until interrupted"""
+    logging.basicConfig(level=logging.INFO)
+    game_server = GameServer(tick_interval=tick_interval, **options)
+
+    async def run():
+        server = await game_server.start(path=path, host=host, port=port)
+        logger.info("Serving on %s", path or f"{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
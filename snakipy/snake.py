@@ -7,7 +7,8 @@ from typing import List, Tuple, Optional
 
 import numpy as np
 
-from snakipy.neuro import NeuralNet
+from snakipy import trace
+from snakipy.neuro import MAX_POLICY_INPUTS, NeuralNet
 
 
 logger = logging.getLogger(__name__)
@@ -22,6 +23,23 @@ def direction_to_vector(direction):
     return {Direction.NORTH: (0, -1), Direction.NORTHEAST: (1, -1)}
 
 
+MOVES = (Direction.NORTH, Direction.EAST, Direction.SOUTH, Direction.WEST)
+
+
+def relative_direction(direction, action):
+    """
+    Turn relative to the current direction.
+    Action 0 turns left, 1 keeps going straight and 2 turns right.
+
+    Examples:
+        >>> relative_direction(Direction.NORTH, 0)
+        <Direction.WEST: 7>
+        >>> relative_direction(Direction.WEST, 2)
+        <Direction.NORTH: 1>
+    """
+    return MOVES[(MOVES.index(direction) + action - 1) % 4]
+
+
 @dataclass
 class Snake:
     coordinates: List[Tuple[int, int]]
@@ -91,7 +109,6 @@ class Snake:
             new_direction = self.direction
 
         head_x, head_y = self.coordinates[-1]
-        logger.debug("Old position: (%s, %s)", head_x, head_y)
 
         # Do not allow 180° turnaround
         if (new_direction, self.direction) in [
@@ -100,11 +117,10 @@ class Snake:
             (Direction.EAST, Direction.WEST),
             (Direction.WEST, Direction.EAST),
         ]:
-            logger.debug(
-                "180° turn from %s to %s not allowed",
-                self.direction.name.title(),
-                new_direction.name.title(),
-            )
+            if trace.ENABLED:
+                trace.emit(
+                    trace.TURN_REJECTED, self.direction._value_, new_direction._value_
+                )
             new_direction = self.direction
 
         if new_direction == Direction.NORTH:
@@ -122,7 +138,8 @@ class Snake:
             new_x = new_x % self.board_width
             new_y = new_y % self.board_height
 
-        logger.debug("New position: (%s, %s)", new_x, new_y)
+        if trace.ENABLED:
+            trace.emit(trace.MOVE, new_x, new_y, new_direction._value_)
 
         new_coordinates = self.coordinates + [(new_x, new_y)]
         new_coordinates = new_coordinates[-self.length :]
@@ -144,21 +161,23 @@ class NeuroSnake(Snake):
     net: Optional[NeuralNet] = None
 
     def __post_init__(self):
-        self.net = NeuralNet(self.input_size, self.hidden_size, 3, dna=self.dna)
+        # Snakes created by `update` inherit the net of their predecessor
+        if self.net is None or getattr(self.net, "dna", None) is not self.dna:
+            self.net = NeuralNet(self.input_size, self.hidden_size, 3, dna=self.dna)
         if self.dna is None:
             logger.debug("No dna found. Initialize randomly")
             self.dna = self.net.dna
 
     def decide_direction(self, view):
-        dirs = (Direction.NORTH, Direction.EAST, Direction.SOUTH, Direction.WEST)
         if self.direction is None:
-            self.direction = random.choice(dirs)
+            self.direction = random.choice(MOVES)
             return self.direction
 
-        net_output = self.net.forward(view)
-        dir_idx = dirs.index(self.direction)
-        idx = np.argmax(net_output) - 1
-        new_dir = dirs[(dir_idx + idx) % 4]
-        logger.debug("Old direction: %s", self.direction)
-        logger.debug("New direction: %s", new_dir)
+        if self.input_size <= MAX_POLICY_INPUTS:
+            decision = self.net.policy(view)
+        else:
+            decision = np.argmax(self.net.forward(view))
+        new_dir = relative_direction(self.direction, decision)
+        if trace.ENABLED:
+            trace.emit(trace.DECISION, self.direction._value_, new_dir._value_)
         return new_dir
@@ -0,0 +1,124 @@
+"""Cheap fitness predictions for pre-screening candidate DNAs"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class Surrogate:
+    """
+    Ridge regression from DNA vectors to the fitness measured so far.
+
+    Candidates whose predicted fitness lies more than `margin` standard
+    deviations of the seen fitness below the elite (the `elite_quantile`
+    of the seen fitness) are flagged by `screen`. The model only makes
+    predictions once `min_samples` results are known, and it is refitted
+    on the latest `max_samples` results every `refit_interval` new ones.
+
+    Predictions for candidates which are played, fully or only for the
+    screening rollouts, are kept, so `accuracy` tells how far the model
+    can be trusted.
+
+    Examples:
+        >>> rng = np.random.RandomState(0)
+        >>> dnas = rng.randn(200, 5)
+        >>> surrogate = Surrogate(min_samples=100)
+        >>> surrogate.add(dnas, dnas @ [1, 2, 0, 0, -1])
+        >>> surrogate.predict([[1, 0, 0, 0, 0]]).round(1).tolist()
+        [1.0]
+        >>> surrogate.screen([[-3, -3, 0, 0, 3], [3, 3, 0, 0, -3]]).tolist()
+        [True, False]
+    """
+
+    def __init__(
+        self,
+        alpha=1.0,
+        margin=2.0,
+        elite_quantile=90,
+        min_samples=50,
+        max_samples=10_000,
+        refit_interval=20,
+    ):
+        self.alpha = alpha
+        self.margin = margin
+        self.elite_quantile = elite_quantile
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.refit_interval = refit_interval
+        self.dnas = []
+        self.fitness = []
+        self.weights = None
+        self.intercept = 0.0
+        self.threshold = None
+        self.predicted = []
+        self.actual = []
+        self.saved_rollouts = 0
+        self._new = 0
+
+    @property
+    def ready(self):
+        return self.weights is not None
+
+    def add(self, dnas, fitness):
+        """Add evaluated candidates and refit if enough of them are new"""
+        dnas = np.atleast_2d(dnas)
+        self.dnas.extend(dnas)
+        self.fitness.extend(np.atleast_1d(fitness))
+        del self.dnas[: -self.max_samples]
+        del self.fitness[: -self.max_samples]
+        self._new += len(dnas)
+        if len(self.fitness) >= self.min_samples and (
+            not self.ready or self._new >= self.refit_interval
+        ):
+            self.fit()
+
+    def fit(self):
+        x = np.array(self.dnas)
+        y = np.array(self.fitness, dtype=float)
+        x_mean, y_mean = x.mean(axis=0), y.mean()
+        xc = x - x_mean
+        self.weights = np.linalg.solve(
+            xc.T @ xc + self.alpha * np.eye(x.shape[1]), xc.T @ (y - y_mean)
+        )
+        self.intercept = y_mean - x_mean @ self.weights
+        self.threshold = np.percentile(y, self.elite_quantile) - self.margin * y.std()
+        self._new = 0
+        if self.predicted:
+            logger.debug("Surrogate refitted on %s results, %s", len(y), self.accuracy())
+
+    def predict(self, dnas):
+        return np.atleast_2d(dnas) @ self.weights + self.intercept
+
+    def screen(self, dnas):
+        """True for every candidate predicted to be far below the elite"""
+        if not self.ready:
+            return np.zeros(len(np.atleast_2d(dnas)), dtype=bool)
+        return self.predict(dnas) < self.threshold
+
+    def record(self, predicted, actual):
+        """Keep predictions of candidates that were played"""
+        self.predicted.extend(np.atleast_1d(predicted))
+        self.actual.extend(np.atleast_1d(actual))
+        del self.predicted[: -self.max_samples]
+        del self.actual[: -self.max_samples]
+
+    def accuracy(self):
+        """
+        Mean absolute error and correlation of the latest recorded
+        predictions, and the number of rollouts saved by screening
+        """
+        predicted = np.array(self.predicted)
+        actual = np.array(self.actual)
+        if len(predicted) > 1 and predicted.std() and actual.std():
+            correlation = float(np.corrcoef(predicted, actual)[0, 1])
+        else:
+            correlation = float("nan")
+        return {
+            "surrogate_mae": (
+                float(np.abs(predicted - actual).mean()) if len(actual) else np.nan
+            ),
+            "surrogate_correlation": correlation,
+            "surrogate_predictions": len(predicted),
+            "saved_rollouts": self.saved_rollouts,
+        }
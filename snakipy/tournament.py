@@ -0,0 +1,331 @@
+"""Tournaments ranking DNAs by playing them against each other"""
+import csv
+import logging
+import multiprocessing
+from itertools import combinations
+
+import numpy as np
+
+from snakipy.archive import DNAArchive
+from snakipy.game import Game
+from snakipy.loops import LoopDetector, play_out
+from snakipy.neuro import NeuralNet
+from snakipy.snake import Direction, NeuroSnake
+
+logger = logging.getLogger(__name__)
+
+
+INPUT_SIZE = 16
+OUTPUT_SIZE = 3
+
+
+class EloRatings:
+    """
+    Elo ratings, updated after every match.
+    A match between several snakes counts as one game for every pair of
+    them, won by the snake with the higher score. The rating change of a
+    snake is averaged over its opponents.
+
+    Examples:
+        >>> ratings = EloRatings(3)
+        >>> ratings.update([0, 1, 2], [30.0, 10.0, 10.0])
+        >>> ratings.ratings.round(1).tolist()
+        [1516.0, 1492.0, 1492.0]
+        >>> ratings.ranking().tolist()
+        [0, 1, 2]
+    """
+
+    def __init__(self, n_players, initial=1500.0, k_factor=32.0):
+        self.k_factor = k_factor
+        self.ratings = np.full(n_players, initial, dtype=float)
+        self.n_matches = np.zeros(n_players, dtype=int)
+
+    def expected(self, a, b):
+        """Expected result of `a` against `b`"""
+        return 1 / (1 + 10 ** ((self.ratings[b] - self.ratings[a]) / 400))
+
+    def update(self, players, scores):
+        players = list(players)
+        changes = np.zeros(len(players))
+        for (i, a), (j, b) in combinations(enumerate(players), 2):
+            result = 0.5 * (np.sign(scores[i] - scores[j]) + 1)
+            change = self.k_factor * (result - self.expected(a, b))
+            changes[i] += change
+            changes[j] -= change
+        self.ratings[players] += changes / (len(players) - 1)
+        self.n_matches[players] += 1
+
+    def ranking(self):
+        """Players sorted from the best to the worst rating"""
+        return np.argsort(-self.ratings, kind="stable")
+
+
+def round_robin(n_players, group_size=2):
+    """
+    Every group of `group_size` players meets once.
+
+    Examples:
+        >>> round_robin(3)
+        [(0, 1), (0, 2), (1, 2)]
+    """
+    return list(combinations(range(n_players), group_size))
+
+
+def swiss_round(ratings, played, group_size=2):
+    """
+    Groups of players with similar ratings.
+    Players are taken from the best rated down, each one is grouped with
+    the next players it has not met yet where possible. Without enough
+    players left for a full group, the last ones sit out this round.
+
+    Examples:
+        >>> ratings = EloRatings(4)
+        >>> ratings.ratings[:] = [1400, 1600, 1500, 1450]
+        >>> swiss_round(ratings, played=set())
+        [(1, 2), (3, 0)]
+        >>> swiss_round(ratings, played={(1, 2)})
+        [(1, 3), (2, 0)]
+    """
+    waiting = [int(player) for player in ratings.ranking()]
+    matches = []
+    while len(waiting) >= group_size:
+        group = [waiting.pop(0)]
+        for candidate in list(waiting):
+            if len(group) == group_size:
+                break
+            if all(tuple(sorted((p, candidate))) not in played for p in group):
+                group.append(candidate)
+                waiting.remove(candidate)
+        # Everybody left has been met already, take the closest ratings
+        while len(group) < group_size:
+            group.append(waiting.pop(0))
+        matches.append(tuple(group))
+    return matches
+
+
+# DNAs and compiled nets of the worker processes, set by `_init_worker`
+_dnas = None
+_nets = {}
+_config = None
+
+
+def _init_worker(dnas, config):
+    global _dnas, _nets, _config
+    _dnas = dnas
+    _nets = {}
+    _config = config
+
+
+def _net(idx):
+    """The net of DNA `idx`, built and compiled once per process"""
+    net = _nets.get(idx)
+    if net is None:
+        net = NeuralNet(INPUT_SIZE, _config["hidden_size"], OUTPUT_SIZE, dna=_dnas[idx])
+        net.policy_table
+        _nets[idx] = net
+    return net
+
+
+def play_match(players, seed):
+    """
+    Play one game with the given DNAs.
+    The start positions rotate with the seed, so repeated matches of the
+    same players are not decided by where each snake starts.
+    Returns the players and their scores.
+    """
+    width, height = _config["width"], _config["height"]
+    n = len(players)
+    shift = seed % n
+    snakes = []
+    for position in range(n):
+        idx = players[(position + shift) % n]
+        net = _net(idx)
+        snakes.append(
+            NeuroSnake.new_snake(
+                (position + 1) * width // (n + 1),
+                height // 2,
+                width,
+                height,
+                Direction.SOUTH,
+                input_size=INPUT_SIZE,
+                hidden_size=_config["hidden_size"],
+                dna=net.dna,
+                net=net,
+            )
+        )
+    game = Game(
+        width,
+        height,
+        snakes=snakes,
+        max_number_of_fruits=_config["n_fruits"],
+        border=True,
+        seed=seed,
+    )
+    play_out(game, _config["n_steps"], LoopDetector())
+    scores = [game.rewards[(player - shift) % n] for player in range(n)]
+    return tuple(players), scores
+
+
+def _play(args):
+    return play_match(*args)
+
+
+class Tournament:
+    """
+    Ranks DNAs by Elo ratings from multi-snake games against each other.
+
+    Matches are played in worker processes which receive all DNAs once,
+    so every net is built and compiled at most once per worker.
+    The ratings are updated as soon as the result of a match arrives.
+    """
+
+    def __init__(
+        self,
+        dnas,
+        group_size=2,
+        n_games=2,
+        n_steps=500,
+        width=40,
+        height=None,
+        n_fruits=10,
+        hidden_size=5,
+        n_workers=1,
+        k_factor=32.0,
+        seed=None,
+    ):
+        self.dnas = np.asarray(dnas, dtype=float)
+        self.group_size = group_size
+        self.n_games = n_games
+        self.config = {
+            "width": width,
+            "height": height if height else width,
+            "n_fruits": n_fruits,
+            "n_steps": n_steps,
+            "hidden_size": hidden_size,
+        }
+        self.n_workers = n_workers
+        self.ratings = EloRatings(len(self.dnas), k_factor=k_factor)
+        self.played = set()
+        self.rng = np.random.RandomState(seed)
+        self._pool = None
+
+    def _map(self, tasks):
+        if self.n_workers > 1:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(
+                    self.n_workers,
+                    initializer=_init_worker,
+                    initargs=(self.dnas, self.config),
+                )
+            return self._pool.imap_unordered(_play, tasks)
+        if _dnas is not self.dnas:
+            _init_worker(self.dnas, self.config)
+        return map(_play, tasks)
+
+    def play(self, matches):
+        """Play `n_games` games of every match and update the ratings"""
+        tasks = [
+            (match, self.rng.randint(2 ** 31))
+            for match in matches
+            for _ in range(self.n_games)
+        ]
+        for players, scores in self._map(tasks):
+            self.ratings.update(players, scores)
+            self.played.update(combinations(sorted(players), 2))
+        logger.info(
+            "Played %s games, best rating %.1f",
+            len(tasks),
+            self.ratings.ratings.max(),
+        )
+
+    def round_robin(self):
+        self.play(round_robin(len(self.dnas), self.group_size))
+
+    def swiss(self, n_rounds):
+        for _ in range(n_rounds):
+            self.play(swiss_round(self.ratings, self.played, self.group_size))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_dnas(dna_files=(), archive_file=None, top=100):
+    """DNAs of the given .npy files and of the `top` best archived ones"""
+    if isinstance(dna_files, str):
+        dna_files = [dna_files]
+    dnas = [np.load(dna_file) for dna_file in dna_files]
+    if archive_file:
+        archive = DNAArchive(archive_file)
+        dnas.extend(archive.best(top)["dna"])
+        archive.close()
+    return dnas
+
+
+def tournament(
+    dna_files=(),
+    archive_file=None,
+    top=100,
+    mode="swiss",
+    n_rounds=10,
+    group_size=2,
+    n_games=2,
+    n_steps=500,
+    width=40,
+    height=None,
+    n_fruits=10,
+    hidden_size=5,
+    n_workers=1,
+    output=None,
+    seed=None,
+):
+    """
+    Rank saved DNAs in a round-robin or Swiss tournament.
+    The ranking is written as CSV to `output` if given.
+    """
+    logging.basicConfig(level=logging.INFO)
+    dnas = load_dnas(dna_files, archive_file, top)
+    if len(dnas) < group_size:
+        raise ValueError(f"At least {group_size} DNAs are needed")
+    logger.info("Tournament of %s DNAs", len(dnas))
+
+    with Tournament(
+        dnas,
+        group_size=group_size,
+        n_games=n_games,
+        n_steps=n_steps,
+        width=width,
+        height=height,
+        n_fruits=n_fruits,
+        hidden_size=hidden_size,
+        n_workers=n_workers,
+        seed=seed,
+    ) as contest:
+        if mode == "round-robin":
+            contest.round_robin()
+        elif mode == "swiss":
+            contest.swiss(n_rounds)
+        else:
+            raise ValueError(f"Unknown mode {mode}")
+
+    ratings = contest.ratings
+    ranking = ratings.ranking()
+    for rank, idx in enumerate(ranking[:10]):
+        logger.info("%s. DNA %s: %.1f", rank + 1, idx, ratings.ratings[idx])
+    if output:
+        with open(output, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["rank", "dna", "rating", "matches"])
+            for rank, idx in enumerate(ranking):
+                writer.writerow(
+                    [rank + 1, idx, ratings.ratings[idx], ratings.n_matches[idx]]
+                )
+    return ranking
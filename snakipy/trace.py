@@ -0,0 +1,250 @@
+"""
+Low overhead event tracing for the hot paths.
+
+Call sites are guarded by the module flag, so disabled tracing costs a
+single attribute lookup:
+
+    if trace.ENABLED:
+        trace.emit(trace.MOVE, x, y, direction._value_)
+
+Arguments are plain ints. Call sites read `_value_` of enum members, which
+is an attribute, while `value` is a comparatively slow property. For the
+same reason the event codes are also available as plain ints like `MOVE`,
+since looking up `Event.MOVE` goes through a descriptor as well.
+
+Events are fixed size records written into a preallocated ring buffer.
+A background thread appends new events to a binary file, and `dump`
+writes the current buffer content on demand. Use `load` to read both.
+"""
+import logging
+import threading
+import time
+from enum import IntEnum
+from itertools import chain
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+ENABLED = False
+
+EVENT_DTYPE = np.dtype(
+    [("time", "<i8"), ("event", "<u2"), ("a", "<i4"), ("b", "<i4"), ("c", "<i4")]
+)
+
+_FLAG_WEIGHTS = 1 << np.arange(16)
+_FLAG_BITS = _FLAG_WEIGHTS.tolist()
+# Bound of the `pack_flags` cache, every pattern of 16 flags fits
+MAX_PACKED_FLAGS = 1 << 16
+_packed_flags = {}
+
+
+class Event(IntEnum):
+    # a: step
+    STEP = 1
+    # a, b: head position, c: bit-packed sensor flags
+    SENSORS = 2
+    # a, b: new head position, c: direction value
+    MOVE = 3
+    # a: old direction value, b: rejected direction value
+    TURN_REJECTED = 4
+    # a: old direction value, b: new direction value
+    DECISION = 5
+    # a: frame number
+    FRAME = 6
+
+
+STEP, SENSORS, MOVE, TURN_REJECTED, DECISION, FRAME = map(int, Event)
+
+
+def pack_flags(arr):
+    """
+    Pack up to 16 binary flags into one integer.
+    Sensor readings repeat a lot, so packed values are cached by the bytes
+    of the flags and most calls are a single dictionary lookup.
+
+    Examples:
+        >>> pack_flags([[1, 0], [0, 1]])
+        9
+    """
+    key = np.asarray(arr, dtype=float).tobytes()
+    flags = _packed_flags.get(key)
+    if flags is None:
+        flat = np.frombuffer(key).tolist()
+        flags = sum([bit for bit, flag in zip(_FLAG_BITS, flat) if flag])
+        if len(_packed_flags) < MAX_PACKED_FLAGS:
+            _packed_flags[key] = flags
+    return flags
+
+
+def pack_flag_rows(arr):
+    """`pack_flags` of every row of a 2d array, as a list"""
+    arr = np.asarray(arr).reshape(len(arr), -1)
+    return (arr.astype(bool) @ _FLAG_WEIGHTS[: arr.shape[1]]).tolist()
+
+
+class RingBuffer:
+    """
+    Preallocated slots holding one event tuple each.
+    Storing a tuple into a list slot is the cheapest write available from
+    Python, the conversion into `EVENT_DTYPE` records happens in `since`.
+    Every tuple starts with the index of its event, so a reader can tell
+    which slots were overwritten while it copied them.
+
+    Examples:
+        >>> buffer = RingBuffer(4)
+        >>> for step in range(6):
+        ...     buffer.emit(Event.STEP, step)
+        >>> events, lost = buffer.since(1)
+        >>> events["a"].tolist(), lost
+        ([2, 3, 4, 5], 1)
+    """
+
+    def __init__(self, capacity):
+        self.slots = [(-1, 0, 0, 0, 0, 0)] * capacity
+        self.capacity = capacity
+        # Total number of events ever written
+        self.head = 0
+
+    def emit(self, event, a=0, b=0, c=0):
+        head = self.head
+        slot = (head, time.perf_counter_ns(), event, a, b, c)
+        self.slots[head % self.capacity] = slot
+        self.head = head + 1
+
+    def emit_many(self, event, a, b, c):
+        """Emit one event per element of `a`, `b` and `c` with one timestamp"""
+        head = self.head
+        now = time.perf_counter_ns()
+        slots, capacity = self.slots, self.capacity
+        for index, args in enumerate(zip(a, b, c), head):
+            slots[index % capacity] = (index, now, event, *args)
+        self.head = head + len(a)
+
+    def since(self, start):
+        """
+        Events with index >= start, in order.
+        Returns the events and the number of events lost to overwriting.
+        """
+        end = self.head
+        first = max(start, end - self.capacity)
+        offset = first % self.capacity
+        n = end - first
+        if offset + n <= self.capacity:
+            slots = self.slots[offset : offset + n]
+        else:
+            slots = self.slots[offset:] + self.slots[: offset + n - self.capacity]
+        slots = np.fromiter(
+            chain.from_iterable(slots), dtype=np.int64, count=6 * len(slots)
+        ).reshape(-1, 6)
+        # Events emitted during the copy overwrite the oldest slots, which
+        # then no longer hold the event index they were copied for
+        slots = slots[slots[:, 0] == np.arange(first, end)]
+        events = np.zeros(len(slots), dtype=EVENT_DTYPE)
+        for i, name in enumerate(EVENT_DTYPE.names):
+            events[name] = slots[:, i + 1]
+        return events, end - start - len(events)
+
+
+class Tracer:
+    def __init__(self, capacity=1 << 16, path=None, flush_interval=1.0):
+        self.buffer = RingBuffer(capacity)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.lost = 0
+        self._flushed = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if path:
+            open(path, "wb").close()
+            self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self._thread.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Append the events written since the last flush to `path`"""
+        if not self.path:
+            return
+        with self._lock:
+            events, lost = self.buffer.since(self._flushed)
+            self._flushed += lost + events.size
+            if lost:
+                self.lost += lost
+                logger.warning("Trace buffer overrun, lost %s events", lost)
+            with open(self.path, "ab") as f:
+                f.write(events.tobytes())
+
+    def dump(self, path):
+        """Write the events currently held in the ring buffer"""
+        events, _ = self.buffer.since(0)
+        with open(path, "wb") as f:
+            f.write(events.tobytes())
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.flush()
+
+
+_tracer = None
+
+
+def enable(capacity=1 << 16, path=None, flush_interval=1.0):
+    """Start tracing. If `path` is given, events are streamed to it."""
+    global ENABLED, _tracer, emit
+    disable()
+    _tracer = Tracer(capacity, path=path, flush_interval=flush_interval)
+    # Call sites look up `trace.emit` on every call, so they reach the
+    # buffer directly instead of going through `_emit`
+    emit = _tracer.buffer.emit
+    ENABLED = True
+    return _tracer
+
+
+def disable():
+    """Stop tracing and flush the remaining events"""
+    global ENABLED, _tracer, emit
+    ENABLED = False
+    emit = _emit
+    if _tracer is not None:
+        _tracer.close()
+        _tracer = None
+
+
+def _emit(event, a=0, b=0, c=0):
+    _tracer.buffer.emit(event, a, b, c)
+
+
+emit = _emit
+
+
+def emit_many(event, a, b, c):
+    _tracer.buffer.emit_many(event, a, b, c)
+
+
+def dump(path):
+    _tracer.dump(path)
+
+
+def load(path):
+    """
+    Read a trace file written by the flusher or by `dump`.
+
+    Examples:
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), "snake.trace")
+        >>> _ = enable(capacity=4)
+        >>> for step in range(6):
+        ...     emit(Event.STEP, step)
+        >>> dump(path)
+        >>> disable()
+        >>> load(path)["a"].tolist()
+        [2, 3, 4, 5]
+    """
+    return np.fromfile(path, dtype=EVENT_DTYPE)
@@ -8,6 +8,7 @@ from typing import Optional, Tuple
 import numpy as np
 import pygame
 
+from snakipy import trace
 from snakipy.game import Game, BoardState
 from snakipy.snake import Direction, NeuroSnake
 
@@ -99,7 +100,8 @@ class UI:
         direction = None
 
         for step in count():
-            logger.debug(step)
+            if trace.ENABLED:
+                trace.emit(trace.FRAME, step)
             self.clear(canvas)
             self.draw(canvas)
             self.refresh(canvas)
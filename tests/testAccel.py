@@ -0,0 +1,89 @@
+import unittest
+
+import numpy as np
+
+from snakipy import accel
+from snakipy.game import Game
+from snakipy.optimize import ParameterSearch
+from snakipy.snake import Direction, NeuroSnake
+
+
+def options(seed):
+    width = 15 if seed % 2 else 20
+    height = 20 if seed % 3 else 25
+    game_options = {
+        "width": width,
+        "height": height,
+        "max_number_of_fruits": 1 + seed % 4,
+        "border": bool(seed % 2),
+        "seed": seed,
+    }
+    snake_options = {
+        "x": width // 2,
+        "y": height // 2,
+        "board_width": width,
+        "board_height": height,
+        "input_size": 16,
+        "hidden_size": 5,
+        "direction": Direction.SOUTH,
+    }
+    return game_options, snake_options
+
+
+def python_trajectory(game_options, snake_options, dna, max_steps):
+    snake = NeuroSnake.new_snake(**snake_options, dna=dna)
+    game = Game(**game_options, player_snake=snake)
+    heads = []
+    for _ in range(max_steps):
+        game.step()
+        if not game.snakes:
+            break
+        heads.append(game.snakes[0].head)
+    (score,) = game.rewards
+    return score, heads, game.n_steps
+
+
+class TestKernel(unittest.TestCase):
+    def test_same_trajectories(self):
+        for seed in range(20):
+            game_options, snake_options = options(seed)
+            dna = np.random.RandomState(seed).randn(103)
+
+            score, heads, n_steps = python_trajectory(
+                game_options, snake_options, dna, 300
+            )
+            kernel_score, kernel_heads = accel.simulate(
+                game_options, snake_options, dna, 300
+            )
+
+            self.assertEqual(len(kernel_heads), n_steps)
+            # The last head of a dead snake is not visible in the game anymore
+            self.assertEqual(
+                [tuple(h) for h in kernel_heads.tolist()][: len(heads)], heads
+            )
+            self.assertEqual(kernel_score, score)
+
+    def test_backends_agree(self):
+        dnas = np.random.RandomState(0).randn(4, 103)
+        for seed in range(12):
+            game_options, snake_options = options(seed)
+            for loop_penalty in (None, -100):
+                searches = [
+                    ParameterSearch(
+                        game_options,
+                        snake_options,
+                        max_steps=200,
+                        n_average=2,
+                        backend=backend,
+                        loop_penalty=loop_penalty,
+                    )
+                    for backend in ("python", "auto")
+                ]
+                costs = [search.benchmark_batch(dnas) for search in searches]
+                np.testing.assert_array_equal(costs[0], costs[1])
+                # Both stop at the first repeated state
+                self.assertEqual(searches[0].stats.steps, searches[1].stats.steps)
+
+
+if __name__ == "__main__":
+    unittest.main()
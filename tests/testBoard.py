@@ -0,0 +1,93 @@
+import unittest
+from collections import Counter
+
+import numpy as np
+
+from snakipy.board import BRUTE_FORCE_FRUITS, RAY_STEPS, ChunkedBoard
+
+WIDTH, HEIGHT = 23, 17
+
+
+def random_board(seed, n_cells, n_fruits):
+    """
+    Board with small tiles and the cell and fruit counts it should contain.
+    Cells just outside the board occur like heads which left it.
+    """
+    rng = np.random.RandomState(seed)
+    board = ChunkedBoard(WIDTH, HEIGHT, tile_size=4)
+    cells, fruits = Counter(), Counter()
+    for _ in range(n_cells):
+        cell = rng.randint(-1, WIDTH + 1), rng.randint(-1, HEIGHT + 1)
+        board.add_snake_cell(*cell)
+        cells[cell] += 1
+    for _ in range(n_fruits):
+        fruit = rng.randint(-1, WIDTH + 1), rng.randint(-1, HEIGHT + 1)
+        board.add_fruit(*fruit)
+        fruits[fruit] += 1
+    # Removing cells and fruits again must leave no traces
+    for cell in list(cells)[::3]:
+        board.remove_snake_cell(*cell)
+        cells[cell] -= 1
+    for fruit in list(fruits)[::3]:
+        board.remove_fruit(*fruit)
+        fruits[fruit] -= 1
+    return board, +cells, +fruits
+
+
+def scan_fruit_ahead(fruits, x, y, direction):
+    dx, dy = RAY_STEPS[direction]
+    x, y = x + dx, y + dy
+    while 0 <= x < WIDTH and 0 <= y < HEIGHT:
+        if (x, y) in fruits:
+            return True
+        x, y = x + dx, y + dy
+    return False
+
+
+class TestBruteForce(unittest.TestCase):
+    def check(self, seed, n_cells, n_fruits):
+        board, cells, fruits = random_board(seed, n_cells, n_fruits)
+        heads = [(x, y) for x in range(WIDTH) for y in range(HEIGHT)]
+        readings = board.sense_all(heads)
+        for (x, y), reading in zip(heads, readings):
+            self.assertEqual(board.snake_count(x, y), cells[x, y])
+            self.assertEqual(board.has_fruit(x, y), (x, y) in fruits)
+            for k, direction in enumerate(RAY_STEPS):
+                dx, dy = RAY_STEPS[direction]
+                expected = scan_fruit_ahead(fruits, x, y, direction)
+                self.assertEqual(board.fruit_ahead(x, y, direction), expected)
+                self.assertEqual(reading[k, 0], expected)
+                # Only cells inside the board are rasterized
+                inside = 0 <= x + dx < WIDTH and 0 <= y + dy < HEIGHT
+                self.assertEqual(reading[k, 1], inside and cells[x + dx, y + dy] > 0)
+            self.assertEqual(
+                board.nearest_fruit_distance(x, y),
+                min(abs(fx - x) + abs(fy - y) for fx, fy in fruits),
+            )
+        self.assertEqual(board.n_tiles, len({board._locate(*c)[0] for c in cells}))
+
+    def test_few_fruits(self):
+        for seed in range(3):
+            self.check(seed, n_cells=60, n_fruits=BRUTE_FORCE_FRUITS // 2)
+
+    def test_many_fruits(self):
+        for seed in range(3):
+            self.check(seed, n_cells=150, n_fruits=4 * BRUTE_FORCE_FRUITS)
+
+    def test_collisions(self):
+        board, cells, _ = random_board(3, n_cells=300, n_fruits=0)
+        collisions = {cell for cell, n in cells.items() if n > 1}
+        self.assertTrue(collisions)
+        self.assertEqual(
+            {
+                (x, y)
+                for x in range(-1, WIDTH + 1)
+                for y in range(-1, HEIGHT + 1)
+                if board.snake_count(x, y) > 1
+            },
+            collisions,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
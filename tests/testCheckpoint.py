@@ -0,0 +1,84 @@
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+from abc_algorithm import Swarm
+
+from snakipy import checkpoint
+from snakipy.optimize import EvolutionStrategy, ParameterSearch
+from snakipy.snake import Direction
+
+
+def square(x):
+    return (np.asarray(x) ** 2).sum(axis=-1)
+
+
+def new_swarm():
+    return Swarm(square, 4, n_employed=5, n_onlooker=5, max_cycles=10)
+
+
+def new_strategy():
+    return EvolutionStrategy(square, 4, population_size=8, max_cycles=10, seed=0)
+
+
+def new_game_strategy():
+    # Without a seed the games are seeded from `np.random`
+    game_options = {"width": 10, "height": 10, "max_number_of_fruits": 3}
+    snake_options = {
+        "x": 5,
+        "y": 5,
+        "board_width": 10,
+        "board_height": 10,
+        "input_size": 16,
+        "hidden_size": 5,
+        "direction": Direction.SOUTH,
+    }
+    search = ParameterSearch(
+        game_options, snake_options, max_steps=50, n_average=2, backend="python"
+    )
+    return EvolutionStrategy(
+        search.benchmark_batch, 103, population_size=4, max_cycles=10, seed=0
+    )
+
+
+class TestResume(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "checkpoint.pkl")
+
+    def check_resume(self, new_search):
+        np.random.seed(0)
+        random.seed(0)
+        search = new_search()
+        expected = [result.copy() for result in search.run()]
+
+        np.random.seed(0)
+        random.seed(0)
+        search = new_search()
+        search.max_cycles = 4
+        results = [result.copy() for result in search.run()]
+        checkpoint.save(self.path, {"search": search, **checkpoint.random_states()})
+        # Whatever happens until the restart must not matter
+        np.random.rand(100)
+        random.random()
+
+        state = checkpoint.load(self.path)
+        checkpoint.restore_random_states(state)
+        search = state["search"]
+        search.max_cycles = 6
+        results.extend(result.copy() for result in search.run())
+        np.testing.assert_array_equal(results, expected)
+
+    def test_swarm(self):
+        self.check_resume(new_swarm)
+
+    def test_evolution_strategy(self):
+        self.check_resume(new_strategy)
+
+    def test_unseeded_games(self):
+        self.check_resume(new_game_strategy)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import unittest
+from collections import Counter
+
+import numpy as np
+
+from snakipy.game import DEATH_REWARD, DISTANCE_REWARD, FRUIT_REWARD, Game
+from snakipy.loops import LoopDetector, play_out
+from snakipy.snake import MOVES, Direction, NeuroSnake, Snake
+
+
+def new_game(seed=0):
+    rng = np.random.RandomState(seed)
+    snakes = [
+        NeuroSnake.new_snake(x, y, 30, 30, Direction.SOUTH, dna=rng.randn(103))
+        for x, y in [(5, 5), (15, 5), (25, 5), (15, 20)]
+    ]
+    return Game(30, 30, snakes=snakes, max_number_of_fruits=5, seed=seed)
+
+
+def state(game):
+    return (
+        [tuple(snake.coordinates) for snake in game.snakes],
+        list(game.fruits),
+        list(game.rewards),
+    )
+
+
+class TestSnapshots(unittest.TestCase):
+    def test_clone_is_independent(self):
+        game = new_game()
+        for _ in range(5):
+            game.step()
+        clone = game.clone()
+        for _ in range(50):
+            clone.step()
+        self.assertNotEqual(state(clone), state(game))
+
+        for _ in range(50):
+            game.step()
+        self.assertEqual(state(clone), state(game))
+
+    def test_restore(self):
+        game = new_game(1)
+        snapshot = game.snapshot()
+        for _ in range(50):
+            game.step()
+        after = state(game)
+
+        game.restore(snapshot)
+        for _ in range(50):
+            game.step()
+        self.assertEqual(state(game), after)
+
+
+class TestLoopDetection(unittest.TestCase):
+    def test_extrapolated_rewards(self):
+        for seed in range(3):
+            game = new_game(seed)
+            play_out(game, 2000)
+
+            looping_game = new_game(seed)
+            detector = LoopDetector()
+            steps = play_out(looping_game, 2000, detector)
+            self.assertLess(steps, game.n_steps)
+            np.testing.assert_allclose(looping_game.rewards, game.rewards)
+
+    def test_penalty(self):
+        game = new_game(2)
+        play_out(game, 2000, LoopDetector(penalty=-1000))
+        self.assertTrue(game.snakes)
+        self.assertTrue(all(game.rewards[slot] < -900 for slot in game._slots))
+
+
+class TestRewardSlots(unittest.TestCase):
+    def expected_rewards(self, game, new_snakes):
+        """Rewards after `game` moved to `new_snakes`, worked out cell by cell"""
+        rewards = list(game.rewards)
+        fruits = list(game.fruits)
+        cells = Counter(cell for snake in new_snakes for cell in snake.coordinates)
+        dead = []
+        for slot, snake in zip(game._slots, new_snakes):
+            x, y = snake.head
+            if not (0 <= x < game.width and 0 <= y < game.height):
+                rewards[slot] += DEATH_REWARD
+                dead.append(slot)
+            if snake.head in fruits:
+                fruits.remove(snake.head)
+                rewards[slot] += FRUIT_REWARD
+            if cells[snake.head] > 1:
+                rewards[slot] += DEATH_REWARD
+                dead.append(slot)
+        return rewards, dead
+
+    def test_rewards_follow_snakes(self):
+        n_deaths = 0
+        for seed in range(5):
+            rng = np.random.RandomState(seed)
+            snakes = [
+                Snake.new_snake(x, y, 12, 12, MOVES[rng.randint(4)])
+                for x, y in [(2, 2), (6, 2), (10, 2), (2, 9), (6, 9), (10, 9)]
+            ]
+            game = Game(12, 12, snakes=snakes, max_number_of_fruits=6, seed=seed)
+            while len(game.snakes) > 1:
+                directions = [MOVES[rng.randint(4)] for _ in game.snakes]
+                new_snakes = [s.update(d) for s, d in zip(game.snakes, directions)]
+                rewards, dead = self.expected_rewards(game, new_snakes)
+                slots = list(game._slots)
+                distances = list(game.closest_distance)
+
+                game.step(directions)
+                for slot, snake in zip(slots, new_snakes):
+                    distance = min(
+                        abs(snake.head[0] - x) + abs(snake.head[1] - y)
+                        for x, y in game.fruits
+                    )
+                    if distances[slot] is not None:
+                        diff = distances[slot] - distance
+                        rewards[slot] += DISTANCE_REWARD * np.sign(diff)
+                np.testing.assert_allclose(game.rewards, rewards)
+                self.assertEqual(game._slots, [s for s in slots if s not in dead])
+                for slot, snake in zip(game._slots, game.snakes):
+                    self.assertEqual(
+                        snake.coordinates, new_snakes[slots.index(slot)].coordinates
+                    )
+                n_deaths += len(set(dead)) * bool(game.snakes)
+        # Snakes died while others were still playing
+        self.assertTrue(n_deaths)
+
+
+class TestSenseAll(unittest.TestCase):
+    def test_matches_reduced_coordinates(self):
+        for seed in range(6):
+            game = new_game(seed)
+            game.border = bool(seed % 2)
+            # Fruits outside the board are ignored by the sensors
+            game.add_fruit(-1, 3)
+            game.add_fruit(30, 30)
+            for _ in range(200):
+                if not game.snakes:
+                    break
+                expected = [
+                    game.reduced_coordinates(snake).flatten() for snake in game.snakes
+                ]
+                np.testing.assert_array_equal(game.sense_all(), expected)
+                game.step()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from snakipy.archive import DNAArchive
+from snakipy.optimize import ParameterSearch
+from snakipy.snake import Direction
+from snakipy.surrogate import Surrogate
+
+GAME_OPTIONS = {"width": 10, "height": 10, "max_number_of_fruits": 3}
+SNAKE_OPTIONS = {
+    "x": 5,
+    "y": 5,
+    "board_width": 10,
+    "board_height": 10,
+    "input_size": 16,
+    "hidden_size": 5,
+    "direction": Direction.SOUTH,
+}
+
+
+def new_search(**kwargs):
+    return ParameterSearch(
+        GAME_OPTIONS, SNAKE_OPTIONS, max_steps=50, backend="python", **kwargs
+    )
+
+
+class TestParameterSearch(unittest.TestCase):
+    def test_archived_seeds_reproduce_fitness(self):
+        path = os.path.join(tempfile.mkdtemp(), "dna.archive")
+        search = new_search(n_average=3)
+        search.archive = DNAArchive(path, dna_size=103)
+        search.benchmark_batch(np.random.RandomState(0).randn(4, 103))
+
+        for record in search.archive.generation(0):
+            self.assertGreaterEqual(record["seed"], 0)
+            seeds = range(record["seed"], record["seed"] + 3)
+            cost, _, _ = new_search()._evaluate(record["dna"], seeds)
+            self.assertEqual(-cost, record["fitness"])
+
+    def test_stats_count_rollouts(self):
+        dnas = np.random.RandomState(1).randn(4, 103)
+        for n_screened in (0, 1):
+            surrogate = Surrogate(min_samples=2)
+            surrogate.add(dnas[:2], [0, 1])
+            # Every candidate is flagged
+            surrogate.threshold = np.inf
+            search = new_search(
+                n_average=3, surrogate=surrogate, n_screened=n_screened
+            )
+            costs = search.benchmark_batch(dnas)
+
+            self.assertEqual(search.stats.evaluations, len(dnas) * n_screened)
+            self.assertEqual(len(search.stats.scores), len(dnas) if n_screened else 0)
+            if n_screened:
+                np.testing.assert_array_equal(search.stats.scores, -costs)
+
+        search = new_search(n_average=3)
+        search.benchmark_batch(dnas)
+        self.assertEqual(search.stats.evaluations, 3 * len(dnas))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from snakipy.server import Client, GameServer
+
+
+class TestGameServer(unittest.TestCase):
+    def test_remote_and_neuro_sessions(self):
+        async def scenario(path):
+            game_server = GameServer(
+                width=10, max_steps=20, tick_interval=0.001, seed=0
+            )
+            server = await game_server.start(path=path)
+            try:
+                clients = [await Client.connect(path) for _ in range(5)]
+                sessions = [(await c.new_session())["session"] for c in clients]
+                neuro = (await clients[0].new_session(agent="neuro"))["session"]
+
+                async def play(client, session):
+                    for _ in range(30):
+                        response = await client.step(session, 1)
+                        if response["done"]:
+                            return response
+                    self.fail("Game did not finish")
+
+                results = await asyncio.gather(
+                    *(play(c, s) for c, s in zip(clients, sessions))
+                )
+                neuro_result = await clients[1].wait(neuro)
+                stats = await clients[0].stats()
+                for client in clients:
+                    await client.close()
+            finally:
+                await game_server.stop(server)
+            return results, neuro_result, stats
+
+        with tempfile.TemporaryDirectory() as tmp:
+            results, neuro_result, stats = asyncio.run(
+                scenario(os.path.join(tmp, "snake.sock"))
+            )
+
+        # Going straight from the centre runs into the wall after five steps
+        for result in results:
+            self.assertTrue(result["done"])
+            self.assertEqual(result["observation"], [])
+        self.assertLessEqual(neuro_result["steps"], 20)
+        self.assertGreaterEqual(stats["ticks"], 5)
+        self.assertGreater(stats["batched_decisions"], 0)
+
+    def test_malformed_requests(self):
+        async def scenario(path):
+            game_server = GameServer(width=10, tick_interval=0.001, seed=0)
+            server = await game_server.start(path=path)
+            try:
+                client = await Client.connect(path)
+                session = (await client.new_session())["session"]
+                responses = [
+                    await client.step(session, None),
+                    await client.step(session, 7),
+                    await client.request(cmd="new", agent="neuro", dna={"a": 1}),
+                ]
+                for line in [b"[1, 2]\n", b"not json\n"]:
+                    client.writer.write(line)
+                    responses.append(json.loads(await client.reader.readline()))
+                # The connection and the tick loop survive all of it
+                last = await client.step(session, 1)
+                await client.close()
+            finally:
+                await game_server.stop(server)
+            return responses, last
+
+        with tempfile.TemporaryDirectory() as tmp:
+            responses, last = asyncio.run(scenario(os.path.join(tmp, "snake.sock")))
+        for response in responses:
+            self.assertIn("error", response)
+        self.assertIn("observation", last)
+
+    def test_results_are_bounded(self):
+        game_server = GameServer(width=10, max_steps=5, seed=0, max_results=2)
+        sessions = [game_server.create_session("neuro") for _ in range(3)]
+        while game_server.sessions:
+            game_server.tick()
+        self.assertEqual(sorted(game_server.results), sessions[1:])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import tempfile
+import unittest
+
+from snakipy import trace
+
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "snake.trace")
+
+    def tearDown(self):
+        trace.disable()
+
+    def test_disable_flushes_and_stops(self):
+        tracer = trace.enable(path=self.path, flush_interval=60)
+        for step in range(10):
+            trace.emit(trace.STEP, step)
+        trace.emit_many(trace.SENSORS, [1, 2], [3, 4], [5, 6])
+        trace.disable()
+
+        self.assertFalse(tracer._thread.is_alive())
+        events = trace.load(self.path)
+        self.assertEqual(events["a"].tolist(), list(range(10)) + [1, 2])
+        self.assertEqual(events["c"][-2:].tolist(), [5, 6])
+        self.assertEqual(tracer.lost, 0)
+
+    def test_enable_replaces_tracer(self):
+        first = trace.enable(path=self.path, flush_interval=60)
+        trace.emit(trace.STEP, 1)
+        other = os.path.join(os.path.dirname(self.path), "other.trace")
+        trace.enable(path=other, flush_interval=60)
+        trace.emit(trace.STEP, 2)
+        trace.disable()
+
+        self.assertFalse(first._thread.is_alive())
+        self.assertEqual(trace.load(self.path)["a"].tolist(), [1])
+        self.assertEqual(trace.load(other)["a"].tolist(), [2])
+
+
+if __name__ == "__main__":
+    unittest.main()